@@ -9,7 +9,7 @@ from flask_compress import Compress
 from flask_rq import RQ
 
 from config import config
-from .assets import app_css, app_js, vendor_css, vendor_js
+from .assets import BUNDLES
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -40,10 +40,22 @@ def create_app(config_name):
     compress.init_app(app)
     RQ(app)
 
+    if app.config['METRICS_ENABLED']:
+        from .metrics import init_metrics
+        init_metrics(app)
+
+    if app.config['SQL_STATS']:
+        from .sqlstats import init_sql_stats
+        init_sql_stats(app)
+
     # Register Jinja template functions
     from .utils import register_template_utils
     register_template_utils(app)
 
+    # Load templates precompiled by `manage.py precompile_templates`
+    from .template_cache import init_template_cache
+    init_template_cache(app)
+
     # Set up asset pipeline
     assets_env = Environment(app)
     dirs = ['assets/styles', 'assets/scripts']
@@ -51,10 +63,12 @@ def create_app(config_name):
         assets_env.append_path(os.path.join(basedir, path))
     assets_env.url_expire = True
 
-    assets_env.register('app_css', app_css)
-    assets_env.register('app_js', app_js)
-    assets_env.register('vendor_css', vendor_css)
-    assets_env.register('vendor_js', vendor_js)
+    for name, bundle in BUNDLES.items():
+        assets_env.register(name, bundle)
+
+    # Use the bundles from `manage.py build_assets`, if it has been run
+    from .static_assets import init_static_assets
+    init_static_assets(app)
 
     # Configure SSL if platform supports it
     if not app.debug and not app.testing and not app.config['SSL_DISABLE']:
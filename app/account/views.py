@@ -1,11 +1,14 @@
-from flask import flash, redirect, render_template, request, url_for, jsonify, current_app
+from flask import (flash, redirect, render_template, request, url_for, jsonify, current_app,
+                   Response)
 from flask_login import (current_user, login_required, login_user,
                          logout_user)
-from flask_rq import get_queue
 
 from . import account
 from .. import db, csrf
-from ..email import send_email
+from ..downsample import lttb
+from ..email import queue_email
+from ..savings_plan import schedule_for
+from ..uploads import presign_upload
 
 from ..models import User, SavingsHistory, EditableHTML, PhoneNumberState, Stage, SiteAttributes
 from .forms import (ChangeEmailForm, ChangePasswordForm, CreatePasswordForm,
@@ -13,11 +16,9 @@ from .forms import (ChangeEmailForm, ChangePasswordForm, CreatePasswordForm,
                     ResetPasswordForm, ProfileForm, SavingsStartEndForm, SavingsHistoryForm,
                     VerifyPhoneNumberForm)
 
-from datetime import timedelta
+from datetime import datetime
+import hashlib
 import json
-import os
-import time
-import boto3
 import random
 
 
@@ -25,8 +26,10 @@ import random
 @login_required
 def index():
     str_format = lambda x: '{0:.2f}'.format(x)
-    modules_left = current_user.modules.count(None)
-    return render_template('account/index.html', str_format=str_format, modules_left=modules_left)
+    modules = current_user.modules
+    modules_left = modules.count(None)
+    return render_template('account/index.html', str_format=str_format, modules=modules,
+                           modules_left=modules_left)
 
 
 @account.route('/login', methods=['GET', 'POST'])
@@ -59,11 +62,11 @@ def register():
         db.session.commit()
         token = user.generate_confirmation_token()
         confirm_link = url_for('account.confirm', token=token, _external=True)
-        get_queue().enqueue(
-            send_email,
+        queue_email(
             recipient=user.email,
             subject='Confirm Your Account',
             template='account/email/confirm',
+            key='confirm:{}'.format(user.id),
             user=user,
             confirm_link=confirm_link)
         flash('A confirmation link has been sent to {}.'.format(user.email),
@@ -101,11 +104,11 @@ def reset_password_request():
             token = user.generate_password_reset_token()
             reset_link = url_for(
                 'account.reset_password', token=token, _external=True)
-            get_queue().enqueue(
-                send_email,
+            queue_email(
                 recipient=user.email,
                 subject='Reset Your Password',
                 template='account/email/reset_password',
+                key='reset_password:{}'.format(user.id),
                 user=user,
                 reset_link=reset_link,
                 next=request.args.get('next'))
@@ -165,11 +168,11 @@ def change_email_request():
             token = current_user.generate_email_change_token(new_email)
             change_email_link = url_for(
                 'account.change_email', token=token, _external=True)
-            get_queue().enqueue(
-                send_email,
+            queue_email(
                 recipient=new_email,
                 subject='Confirm Your New Email',
                 template='account/email/change_email',
+                key='change_email:{}:{}'.format(current_user.id, new_email),
                 # current_user is a LocalProxy, we want the underlying user
                 # object
                 user=current_user._get_current_object(),
@@ -199,16 +202,20 @@ def confirm_request():
     """Respond to new user's request to confirm their account."""
     token = current_user.generate_confirmation_token()
     confirm_link = url_for('account.confirm', token=token, _external=True)
-    get_queue().enqueue(
-        send_email,
-        recipient=current_user.email,
-        subject='Confirm Your Account',
-        template='account/email/confirm',
-        # current_user is a LocalProxy, we want the underlying user object
-        user=current_user._get_current_object(),
-        confirm_link=confirm_link)
-    flash('A new confirmation link has been sent to {}.'.format(
-        current_user.email), 'warning')
+    if queue_email(
+            recipient=current_user.email,
+            subject='Confirm Your Account',
+            template='account/email/confirm',
+            key='confirm:{}'.format(current_user.id),
+            # current_user is a LocalProxy, we want the underlying user object
+            user=current_user._get_current_object(),
+            confirm_link=confirm_link):
+        flash('A new confirmation link has been sent to {}.'.format(
+            current_user.email), 'warning')
+    else:
+        flash('A confirmation link was just sent to {}. Please check your '
+              'inbox before asking for another.'.format(current_user.email),
+              'warning')
     return redirect(url_for('main.index'))
 
 
@@ -264,11 +271,11 @@ def join_from_invite(user_id, token):
             user_id=user_id,
             token=token,
             _external=True)
-        get_queue().enqueue(
-            send_email,
+        queue_email(
             recipient=new_user.email,
             subject='You Are Invited To Join',
             template='account/email/invite',
+            key='invite:{}'.format(new_user.id),
             user=new_user,
             invite_link=invite_link)
     return redirect(url_for('main.index'))
@@ -335,7 +342,7 @@ def primary_information():
 @account.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    airtable_html = SiteAttributes.query.all()[0].airtable_html
+    airtable_html = SiteAttributes.get_settings().form_html
     return render_template('account/airtable.html', airtable_html=airtable_html)
 
 
@@ -363,15 +370,22 @@ def verify():
 @login_required
 @csrf.exempt
 def modules_update():
-    data = json.loads(request.form['data'])
-    new_modules = list(current_user.modules)
-    new_modules[data['module_num']] = {
-        'filename': data['filename'],
-        'certificate_url': data['certificate_url']
-    }
-    current_user.modules = new_modules
-    db.session.add(current_user)
-    db.session.commit()
+    try:
+        data = json.loads(request.form['data'])
+        module_num = data['module_num']
+        if isinstance(module_num, bool) or not isinstance(
+                module_num, (int, str)):
+            raise ValueError
+        module_num = int(module_num)
+        filename, certificate_url = data['filename'], data['certificate_url']
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid module update.'}), 400
+    # The page numbers its upload fields from 0
+    num_modules = SiteAttributes.get_num_modules()
+    if not 0 <= module_num < num_modules:
+        return jsonify({'error': 'Module must be between 0 and {}.'.format(
+            num_modules - 1)}), 400
+    current_user.complete_module(module_num + 1, filename, certificate_url)
     flash('Your progress has been updated.', 'success')
     return jsonify({'status': 200})
 
@@ -407,21 +421,12 @@ def savings():
         form.start_date.data = current_user.savings_start_date
     if current_user.savings_end_date is not None:
         form.end_date.data = current_user.savings_end_date
-    weeks = None
-    if current_user.savings_start_date is not None and current_user.savings_end_date is not None:
-        startd = current_user.savings_start_date
-        endd = current_user.savings_end_date
-        monday1 = (startd-timedelta(days=startd.weekday()))
-        monday2 = (endd-timedelta(days=endd.weekday()))
-        num_weeks = (monday2-monday1).days/7
-        increment = current_user.goal_amount/float(num_weeks)
-        weeks = []
-        for i in range(int(num_weeks)):
-            weeks.append(round(increment*(i+1), 2))
+    weeks = schedule_for(current_user)
     return render_template('account/savings.html', form=form, weeks=weeks)
 
 
 @account.route('/savingsHistory/', methods = ['GET', 'POST'])
+@login_required
 def savings_history():
     
     form = SavingsHistoryForm()
@@ -432,53 +437,73 @@ def savings_history():
         db.session.add(savings)
         db.session.commit()
 
-    student_profile = SavingsHistory.query.filter_by(user_id=current_user.id).all()
-    balance_array = []
-    date_added = []
+    return render_template('account/savings_history.html', form = form)
 
-    if student_profile is not None:
-        for i in range(len(student_profile)):
-            balance_array.append(student_profile[i].balance)
-            date_added.append(student_profile[i].date)
 
-    return render_template('account/savings_history.html', form = form, 
-        balance = balance_array, date = date_added, 
-    lenBalance = len(balance_array), lenDate = len(date_added))
+def _date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+@account.route('/savingsHistory/series')
+@login_required
+def savings_series():
+    """The scholar's balances between the `start` and `end` dates as JSON,
+    downsampled to at most `points` points."""
+    try:
+        start, end = _date_arg('start'), _date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD.'}), 400
+    points = max(3, min(request.args.get('points', 200, type=int), 2000))
+
+    # The summary is read from the (user_id, date, balance) index, so an
+    # unchanged chart is revalidated without loading the series
+    summary = SavingsHistory.summary(current_user.id, start, end)
+    etag = hashlib.sha1(repr(
+        (current_user.id, start, end, points) + tuple(summary)).encode(
+            'utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        series = lttb([(date.toordinal(), balance) for date, balance in
+                       SavingsHistory.series(current_user.id, start, end)],
+                      points)
+        response = jsonify({
+            'dates': [datetime.fromordinal(day).date().isoformat()
+                      for day, _ in series],
+            'balances': [balance for _, balance in series],
+            'total': summary[0],
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @account.route('/sign-s3/')
 @login_required
 def sign_s3():
-    # Load necessary information into the application
-    S3_BUCKET = os.environ.get('S3_BUCKET')
-    S3_REGION = os.environ.get('S3_REGION')
-    TARGET_FOLDER = 'json/'
-    # Load required data from the request
-    pre_file_name = request.args.get('file-name')
-    file_name = ''.join(pre_file_name.split('.')[:-1]) + str(time.time()).replace('.','-') + '.' + ''.join(pre_file_name.split('.')[-1:])
-    file_type = request.args.get('file-type')
-
-    # Initialise the S3 client
-    s3 = boto3.client('s3', 'us-west-2')
-
-    # Generate and return the presigned URL
-    presigned_post = s3.generate_presigned_post(
-            Bucket = S3_BUCKET,
-            Key = TARGET_FOLDER + file_name,
-            Fields = {"acl": "public-read", "Content-Type": file_type},
-            Conditions = [
-                {"acl": "public-read"},
-                {"Content-Type": file_type}
-                ],
-            ExpiresIn = 6000
-            )
-
-    # Return the data to the client
-    return json.dumps({
-        'data': presigned_post,
-        'url_upload': 'https://%s.%s.amazonaws.com' % (S3_BUCKET, S3_REGION),
-        'url': 'https://%s.amazonaws.com/%s/json/%s' % (S3_REGION, S3_BUCKET, file_name)
-        })
+    return json.dumps(presign_upload(request.args.get('file-name'),
+                                     request.args.get('file-type')))
+
+
+@account.route('/sign-s3/batch', methods=['POST'])
+@login_required
+@csrf.exempt
+def sign_s3_batch():
+    """Presigned uploads for several files, posted as
+    {"files": [{"name": ..., "type": ...}, ...]}."""
+    files = (request.get_json(silent=True) or {}).get('files')
+    limit = current_app.config['S3_SIGN_BATCH_LIMIT']
+    if not isinstance(files, list) or not files or len(files) > limit or \
+            not all(isinstance(f, dict) and f.get('name') and
+                    isinstance(f.get('type'), str) and f['type']
+                    for f in files):
+        return jsonify({'error': 'Send between 1 and {} files, each with a '
+                                 'name and type.'.format(limit)}), 400
+    return jsonify({'files': [presign_upload(f['name'], f['type'])
+                              for f in files]})
 
 
 @account.route('/about')
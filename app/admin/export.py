@@ -0,0 +1,159 @@
+"""
+Streaming CSV and XLSX exports of scholars and their savings history for the
+admin console.
+
+Rows are read with `yield_per`, which also asks the database driver for a
+server-side cursor, and written out as they arrive, so an export holds only
+a batch of rows in memory however many there are.
+"""
+import csv
+import datetime
+import io
+import tempfile
+from collections import OrderedDict
+
+import xlsxwriter
+
+from .. import db
+from ..models import PlaidBankItem, Role, SavingsHistory, User
+from .user_listing import filter_users
+
+# Rows fetched from the database at a time
+BATCH_SIZE = 1000
+
+# CSV rows written per chunk of the response
+CSV_FLUSH_ROWS = 500
+
+# Bytes per chunk when streaming a finished XLSX file
+XLSX_CHUNK_SIZE = 64 * 1024
+
+# Leading characters that make a spreadsheet read a CSV cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+_user_columns = [
+    ('id', User.id),
+    ('first_name', User.first_name),
+    ('last_name', User.last_name),
+    ('email', User.email),
+    ('role', Role.name),
+    ('stage', User.stage),
+    ('bank_acct_open', User.bank_acct_open),
+    ('savings_start_date', User.savings_start_date),
+    ('savings_end_date', User.savings_end_date),
+    ('goal_amount', User.goal_amount),
+    ('bank_balance', PlaidBankItem.balance),
+]
+
+USER_COLUMNS = OrderedDict(_user_columns)
+
+SAVINGS_COLUMNS = OrderedDict(
+    [('user_id', User.id)] + _user_columns[1:5] +
+    [('date', SavingsHistory.date), ('balance', SavingsHistory.balance)])
+
+# Each dataset's columns and the column its date range applies to
+DATASETS = OrderedDict([
+    ('scholars', (USER_COLUMNS, User.bank_acct_open)),
+    ('savings_history', (SAVINGS_COLUMNS, SavingsHistory.date)),
+])
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.'
+             'spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def export_query(dataset, columns, start=None, end=None, role_id=None,
+                 stage=None):
+    """
+    Return a query for the `columns` of `dataset`, in order, fetching
+    `BATCH_SIZE` rows at a time. `start` and `end` bound the dataset's date
+    column, inclusively.
+    """
+    if dataset not in DATASETS:
+        raise ValueError('Unknown dataset {}.'.format(dataset))
+    available, date_column = DATASETS[dataset]
+    unknown = [c for c in columns if c not in available]
+    if unknown or not columns:
+        raise ValueError('Unknown columns: {}.'.format(', '.join(unknown)))
+
+    query = db.session.query(*[available[c].label(c) for c in columns])
+    if dataset == 'savings_history':
+        query = query.select_from(SavingsHistory).join(
+            User, SavingsHistory.user_id == User.id)
+        order = (SavingsHistory.user_id, SavingsHistory.date,
+                 SavingsHistory.id)
+    else:
+        query = query.select_from(User)
+        order = (User.id,)
+    query = query.outerjoin(Role, User.role_id == Role.id).outerjoin(
+        PlaidBankItem, User.bank_item_id == PlaidBankItem.id)
+
+    query = filter_users(query, role_id, stage)
+    if start is not None:
+        query = query.filter(date_column >= start)
+    if end is not None:
+        query = query.filter(date_column <= end)
+    return query.order_by(*order).yield_per(BATCH_SIZE)
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Scholars fill in their own names; quote anything a spreadsheet
+        # would otherwise evaluate.
+        return "'" + value
+    return value
+
+
+def stream_csv(columns, rows):
+    """Yield the CSV text of `rows`, a few hundred rows at a time."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_csv_value(value) for value in row])
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def stream_xlsx(columns, rows):
+    """
+    Yield an XLSX workbook of `rows`. The workbook is written in
+    xlsxwriter's constant memory mode, which flushes each row to disk as
+    soon as the next starts, and the finished file is streamed from disk.
+    Text is always written as text, never as a formula or link.
+    """
+    with tempfile.TemporaryFile() as out:
+        workbook = xlsxwriter.Workbook(out, {
+            'constant_memory': True,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        })
+        sheet = workbook.add_worksheet()
+        bold = workbook.add_format({'bold': True})
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        sheet.write_row(0, 0, columns, bold)
+        for r, row in enumerate(rows, 1):
+            for c, value in enumerate(row):
+                if isinstance(value, datetime.date):
+                    sheet.write_datetime(r, c, value, date_format)
+                else:
+                    sheet.write(r, c, value)
+        workbook.close()
+
+        out.seek(0)
+        chunk = out.read(XLSX_CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = out.read(XLSX_CHUNK_SIZE)
+
+
+def stream_export(file_format, columns, rows):
+    if file_format == 'xlsx':
+        return stream_xlsx(columns, rows)
+    return stream_csv(columns, rows)
@@ -1,12 +1,15 @@
 from flask_wtf import Form
+from flask_wtf.file import FileAllowed, FileField, FileRequired
 from wtforms import ValidationError
 from wtforms.ext.sqlalchemy.fields import QuerySelectField
-from wtforms.fields import PasswordField, StringField, SubmitField, TextAreaField, SelectField
+from wtforms.fields import (PasswordField, StringField, SubmitField, TextAreaField, SelectField,
+                            SelectMultipleField)
 from wtforms.fields.html5 import EmailField, DateField
-from wtforms.validators import Email, EqualTo, InputRequired, Length
+from wtforms.validators import Email, EqualTo, InputRequired, Length, Optional
 
 from .. import db
 from ..models import Role, User, PlaidBankAccount
+from .export import DATASETS, FORMATS
 
 
 class ChangeUserEmailForm(Form):
@@ -55,6 +58,45 @@ class InviteUserForm(Form):
             raise ValidationError('Email already registered.')
 
 
+class InviteUsersCSVForm(Form):
+    role = QuerySelectField(
+        'Default account type',
+        validators=[InputRequired()],
+        get_label='name',
+        query_factory=lambda: db.session.query(Role).order_by('permissions'))
+    csv_file = FileField(
+        'CSV file',
+        validators=[
+            FileRequired(),
+            FileAllowed(['csv'], 'Upload a .csv file.')
+        ])
+    submit = SubmitField('Invite')
+
+
+class ExportForm(Form):
+    dataset = SelectField(
+        'Data',
+        choices=[('scholars', 'Scholars'),
+                 ('savings_history', 'Savings history')])
+    columns = SelectMultipleField(
+        'Columns (leave empty for all)',
+        choices=[(c, c) for c in sorted(set().union(
+            *[columns for columns, _ in DATASETS.values()]))])
+    role = QuerySelectField(
+        'Account type',
+        allow_blank=True,
+        blank_text='All account types',
+        get_label='name',
+        query_factory=lambda: db.session.query(Role).order_by('permissions'))
+    start = DateField(
+        'From (bank account opened, or savings date)',
+        format='%Y-%m-%d', validators=[Optional()])
+    end = DateField('To', format='%Y-%m-%d', validators=[Optional()])
+    file_format = SelectField(
+        'Format', choices=[(f, f.upper()) for f in sorted(FORMATS)])
+    submit = SubmitField('Export')
+
+
 class NewUserForm(InviteUserForm):
     password = PasswordField(
         'Password',
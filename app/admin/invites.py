@@ -0,0 +1,162 @@
+"""
+Bulk invitations from an uploaded CSV of scholars.
+"""
+import codecs
+import csv
+import io
+import re
+import uuid
+from datetime import datetime
+from operator import itemgetter
+
+from flask import url_for
+from flask_rq import get_connection
+
+from .. import db
+from ..email import queue_bulk_email
+from ..models import Role, User
+
+CSV_COLUMNS = ['first_name', 'last_name', 'email', 'bank_acct_open', 'role']
+REPORT_COLUMNS = ['line', 'email', 'error']
+REPORT_TTL = 24 * 60 * 60
+
+# Rows are checked against existing accounts this many at a time
+LOOKUP_BATCH_SIZE = 500
+
+email_regex = re.compile(r'^.+@([^.@][^@]+)$', re.IGNORECASE)
+
+
+class InviteResult(object):
+    def __init__(self):
+        self.users = []
+        self.errors = []
+
+    def error(self, line, email, message):
+        self.errors.append({'line': line, 'email': email, 'error': message})
+
+
+def _parse_row(row, roles, default_role):
+    """Validate one CSV row, returning the `User` kwargs or raising
+    `ValueError` with a message for the report."""
+    fields = {}
+    for name in ('first_name', 'last_name', 'email'):
+        value = (row.get(name) or '').strip()
+        if not value:
+            raise ValueError('Missing {}.'.format(name))
+        if len(value) > 64:
+            raise ValueError('{} is longer than 64 characters.'.format(name))
+        fields[name] = value
+    fields['email'] = fields['email'].lower()
+    if not email_regex.match(fields['email']):
+        raise ValueError('Invalid email address.')
+
+    opened = (row.get('bank_acct_open') or '').strip()
+    if opened:
+        try:
+            fields['bank_acct_open'] = datetime.strptime(opened,
+                                                         '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError('bank_acct_open must look like YYYY-MM-DD.')
+
+    role_name = (row.get('role') or '').strip().lower()
+    if role_name and role_name not in roles:
+        raise ValueError('Unknown account type {}.'.format(row['role']))
+    fields['role'] = roles[role_name] if role_name else default_role
+    return fields
+
+
+def _add_batch(batch, seen, result):
+    """Create users for a batch of parsed rows that don't already exist."""
+    emails = [fields['email'] for _, fields in batch]
+    lower_email = db.func.lower(User.email)
+    existing = set(email for email, in db.session.query(lower_email).filter(
+        lower_email.in_(emails)))
+    for line, fields in batch:
+        email = fields['email']
+        if email in existing:
+            result.error(line, email, 'Email already registered.')
+        elif email in seen:
+            result.error(line, email, 'Email appears earlier in the file.')
+        else:
+            seen.add(email)
+            user = User(**fields)
+            db.session.add(user)
+            result.users.append(user)
+
+
+def import_invites(stream, default_role):
+    """
+    Read scholars from a CSV file object and add them as invited users in
+    a single transaction. Rows that fail validation are skipped and recorded
+    in the result instead of failing the whole upload.
+    """
+    result = InviteResult()
+    roles = dict((role.name.lower(), role) for role in Role.query.all())
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+    missing = set(['first_name', 'last_name', 'email']).difference(
+        reader.fieldnames or [])
+    if missing:
+        result.error(1, '', 'Missing column(s): {}.'.format(
+            ', '.join(sorted(missing))))
+        return result
+
+    seen = set()
+    batch = []
+    for row in reader:
+        line = reader.line_num
+        try:
+            batch.append((line, _parse_row(row, roles, default_role)))
+        except ValueError as e:
+            result.error(line, (row.get('email') or '').strip(), str(e))
+        if len(batch) >= LOOKUP_BATCH_SIZE:
+            _add_batch(batch, seen, result)
+            batch = []
+    if batch:
+        _add_batch(batch, seen, result)
+    # Rows that failed validation were recorded before their batch's
+    result.errors.sort(key=itemgetter('line'))
+
+    db.session.flush()
+    user_ids = [user.id for user in result.users]
+    db.session.commit()
+    # Committing expires every user; reload them with one query so the
+    # invite emails can be built without a SELECT per user.
+    if user_ids:
+        User.query.filter(User.id.in_(user_ids)).all()
+    return result
+
+
+def send_invites(users):
+    """Add invite emails for `users` to the email outbox, to be sent after
+    any transactional email that is due."""
+    tokens = User.generate_confirmation_tokens(users)
+    queue_bulk_email([
+        dict(
+            recipient=user.email,
+            subject='You Are Invited To Join',
+            template='account/email/invite',
+            key='invite:{}'.format(user.id),
+            user=user,
+            invite_link=url_for(
+                'account.join_from_invite',
+                user_id=user.id,
+                token=token,
+                _external=True)) for user, token in zip(users, tokens)
+    ])
+
+
+def save_report(errors):
+    """Store a CSV of per-row errors in Redis and return its id."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=REPORT_COLUMNS)
+    writer.writeheader()
+    writer.writerows(errors)
+    report_id = uuid.uuid4().hex
+    get_connection().set('invite_report:' + report_id, out.getvalue(),
+                         ex=REPORT_TTL)
+    return report_id
+
+
+def load_report(report_id):
+    report = get_connection().get('invite_report:' + report_id)
+    return report.decode('utf-8') if report is not None else None
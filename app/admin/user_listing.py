@@ -0,0 +1,107 @@
+"""
+Keyset-paginated, sorted and filtered queries over users for the admin
+console.
+"""
+import base64
+import json
+
+from sqlalchemy.orm import joinedload
+
+from .. import db
+from ..models import Stage, User
+
+SORT_COLUMNS = {
+    'first_name': User.first_name,
+    'last_name': User.last_name,
+    'email': User.email,
+}
+
+STAGE_FILTERS = [
+    ('Confirmed email', Stage.COMPLETED_EMAIL_CONF),
+    ('Primary information', Stage.COMPLETED_PRIMARY_INFO),
+    ('Verified phone', Stage.COMPLETED_PHONE_CONF),
+    ('Profile form', Stage.COMPLETED_PROFILE_FORM),
+    ('Modules', Stage.COMPLETED_MODULES),
+    ('Savings balance', Stage.COMPLETED_BALANCE),
+    ('Complete', Stage.COMPLETE),
+    ('Archived', Stage.ARCHIVED),
+]
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(value, user_id):
+    raw = json.dumps([value, user_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the (sort value, user id) a page starts after."""
+    try:
+        value, user_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return value, int(user_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor.')
+
+
+def filter_users(query, role_id=None, stage=None):
+    """Restrict a user query to one role and to users that reached every
+    bit of `stage`."""
+    if role_id is not None:
+        query = query.filter(User.role_id == role_id)
+    if stage:
+        query = query.filter(User.stage.op('&')(stage) == stage)
+    return query
+
+
+def users_page(sort='last_name', descending=False, role_id=None, stage=None,
+               after=None, limit=50):
+    """
+    Return one page of users, with their role and bank item loaded, and the
+    cursor for the next page (or None on the last page). Pages are ordered
+    by the `sort` column and then id, and continue from the `after` cursor
+    rather than an offset so deep pages cost the same as the first. Users
+    with no value in the `sort` column sort as an empty string, since a
+    NULL would never match the cursor comparison.
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError('Cannot sort by {}.'.format(sort))
+    column = db.func.coalesce(SORT_COLUMNS[sort], '')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = filter_users(User.query, role_id, stage).options(
+        joinedload(User.role), joinedload(User.bank_item))
+    if after is not None:
+        value, user_id = decode_cursor(after)
+        if descending:
+            query = query.filter(db.or_(
+                column < value, db.and_(column == value, User.id < user_id)))
+        else:
+            query = query.filter(db.or_(
+                column > value, db.and_(column == value, User.id > user_id)))
+    if descending:
+        query = query.order_by(column.desc(), User.id.desc())
+    else:
+        query = query.order_by(column, User.id)
+
+    users = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        next_cursor = encode_cursor(getattr(last, sort) or '', last.id)
+    return users, next_cursor
+
+
+def user_row(user):
+    """The JSON representation of a user in the admin table."""
+    return {
+        'id': user.id,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email,
+        'role': user.role.name if user.role else None,
+        'confirmed': user.has(Stage.COMPLETED_EMAIL_CONF),
+        'balance': user.bank_item.balance if user.bank_item else None,
+    }
@@ -1,13 +1,29 @@
-from flask import abort, flash, redirect, render_template, url_for, request
+import hmac
+from collections import defaultdict
+
+from flask import (abort, current_app, flash, redirect, render_template, url_for, request, Response,
+                   jsonify, stream_with_context)
 from flask_login import current_user, login_required
-from flask_rq import get_queue
+from flask_rq import get_connection
+from sqlalchemy.orm import joinedload
 from .forms import (ChangeAccountTypeForm, ChangeUserEmailForm, InviteUserForm,
-                    NewUserForm, AirtableSurveyHTML, AirtableGridHTML, LinkBankAccount)
+                    InviteUsersCSVForm, NewUserForm, AirtableSurveyHTML, AirtableGridHTML,
+                    LinkBankAccount, ExportForm)
 from . import admin
+from .export import DATASETS, FORMATS, export_query, stream_export
+from .invites import CSV_COLUMNS, import_invites, load_report, save_report, send_invites
+from .user_listing import STAGE_FILTERS, user_row, users_page
 from .. import db, csrf
 from ..decorators import admin_required
-from ..email import send_email
-from ..models import Role, User, EditableHTML, SiteAttributes, PlaidBankAccount, PlaidBankItem
+from ..email import queue_email
+from ..job_stats import PERCENTILES, queue_stats
+from ..scheduler import schedule_status
+from ..metrics import render_metrics
+from ..models import (Role, User, EditableHTML, SiteAttributes, PlaidBankAccount, PlaidBankItem,
+                      ModuleCompletion, EmailOutbox)
+from ..plaid_sync import request_sync
+from ..savings_plan import cohort_progress
+from ..search import search_users
 from config import Config
 
 
@@ -60,11 +76,11 @@ def invite_user():
             user_id=user.id,
             token=token,
             _external=True)
-        get_queue().enqueue(
-            send_email,
+        queue_email(
             recipient=user.email,
             subject='You Are Invited To Join',
             template='account/email/invite',
+            key='invite:{}'.format(user.id),
             user=user,
             invite_link=invite_link, )
         flash('User {} successfully invited'.format(user.full_name()),
@@ -72,15 +88,181 @@ def invite_user():
     return render_template('admin/new_user.html', form=form)
 
 
+@admin.route('/invite-users-csv', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def invite_users_csv():
+    """Invites every scholar listed in an uploaded CSV file."""
+    form = InviteUsersCSVForm()
+    result = None
+    report_id = None
+    if form.validate_on_submit():
+        result = import_invites(form.csv_file.data.stream, form.role.data)
+        if result.users:
+            send_invites(result.users)
+            flash('{} users successfully invited'.format(len(result.users)),
+                  'form-success')
+        if result.errors:
+            report_id = save_report(result.errors)
+            flash('{} rows could not be imported'.format(len(result.errors)),
+                  'form-error')
+    return render_template('admin/invite_users_csv.html', form=form,
+                           result=result, report_id=report_id,
+                           columns=CSV_COLUMNS)
+
+
+@admin.route('/invite-users-csv/report/<report_id>')
+@login_required
+@admin_required
+def invite_report(report_id):
+    """Download the rows of a CSV upload that could not be imported."""
+    report = load_report(report_id)
+    if report is None:
+        abort(404)
+    return Response(report, mimetype='text/csv', headers={
+        'Content-Disposition': 'attachment; filename=invite-errors.csv'})
+
+
 @admin.route('/users')
 @login_required
 @admin_required
 def registered_users():
     """View all registered users."""
-    users = User.query.all()
     roles = Role.query.all()
     return render_template(
-        'admin/registered_users.html', users=users, roles=roles)
+        'admin/registered_users.html', roles=roles, stages=STAGE_FILTERS)
+
+
+@admin.route('/users/data')
+@login_required
+@admin_required
+def registered_users_data():
+    """One page of registered users as JSON, for the users table."""
+    try:
+        users, next_cursor = users_page(
+            sort=request.args.get('sort', 'last_name'),
+            descending=request.args.get('order') == 'desc',
+            role_id=request.args.get('role', type=int),
+            stage=request.args.get('stage', type=int),
+            after=request.args.get('after') or None,
+            limit=request.args.get('limit', 50, type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = []
+    for user in users:
+        row = user_row(user)
+        row['url'] = url_for('admin.user_info', user_id=user.id)
+        rows.append(row)
+    return jsonify({'users': rows, 'next': next_cursor})
+
+
+@admin.route('/users/search')
+@login_required
+@admin_required
+def search_registered_users():
+    """Users best matching a search over names and emails, as JSON."""
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    rows = []
+    for user in search_users(request.args.get('q', ''), limit):
+        row = user_row(user)
+        row['url'] = url_for('admin.user_info', user_id=user.id)
+        rows.append(row)
+    return jsonify({'users': rows})
+
+
+@admin.route('/export', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def export_data():
+    """Download scholars or their savings history as CSV or XLSX."""
+    form = ExportForm()
+    if form.validate_on_submit():
+        dataset = form.dataset.data
+        columns = form.columns.data or list(DATASETS[dataset][0])
+        try:
+            query = export_query(
+                dataset, columns,
+                start=form.start.data, end=form.end.data,
+                role_id=form.role.data.id if form.role.data else None)
+        except ValueError as e:
+            flash(str(e), 'form-error')
+        else:
+            mimetype, extension = FORMATS[form.file_format.data]
+            body = stream_export(form.file_format.data, columns, query)
+            return Response(
+                stream_with_context(body), mimetype=mimetype, headers={
+                    'Content-Disposition': 'attachment; filename={}.{}'.format(
+                        dataset, extension)})
+    return render_template('admin/download_csv.html', form=form)
+
+
+@admin.route('/savings-progress')
+@login_required
+@admin_required
+def savings_progress():
+    """Every scholar's savings against their weekly plan."""
+    progress = cohort_progress()
+    if request.args.get('behind'):
+        progress = [p for p in progress if p.behind]
+    return render_template('admin/savings_progress.html', progress=progress,
+                           behind_only=bool(request.args.get('behind')))
+
+
+@admin.route('/modules')
+@login_required
+@admin_required
+def module_progress():
+    """How many scholars have completed each module."""
+    scholars = User.query.join(Role).filter(Role.index == 'account').count()
+    counts = ModuleCompletion.completion_counts()
+    num_modules = max(
+        [SiteAttributes.get_settings().num_modules] + list(counts))
+    per_scholar = ModuleCompletion.completed_per_scholar()
+    per_scholar[0] = max(scholars - sum(per_scholar.values()), 0)
+    return render_template(
+        'admin/module_progress.html', scholars=scholars, counts=counts,
+        num_modules=num_modules, per_scholar=per_scholar)
+
+
+@admin.route('/modules/<int:module_num>')
+@login_required
+@admin_required
+def module_completions(module_num):
+    """The scholars who have completed a module."""
+    completions = ModuleCompletion.scholars_completed(module_num).all()
+    return render_template('admin/module_completions.html',
+                           module_num=module_num, completions=completions)
+
+
+@admin.route('/queues')
+@login_required
+@admin_required
+def job_queues():
+    """Background job queues, with their jobs' wait and run times, the
+    schedule of recurring jobs and the state of the email outbox."""
+    connection = get_connection()
+    return render_template(
+        'admin/job_queues.html',
+        queues=queue_stats(connection),
+        percentiles=PERCENTILES,
+        schedule=schedule_status(connection,
+                                 current_app.config['RQ_SCHEDULE']),
+        outbox=EmailOutbox.status_counts())
+
+
+@admin.route('/metrics')
+def metrics():
+    """Request metrics in the Prometheus text format, for admins or a
+    scraper sending `Authorization: Bearer <METRICS_TOKEN>`."""
+    token = current_app.config['METRICS_TOKEN']
+    if not (token and hmac.compare_digest(
+            request.headers.get('Authorization', ''), 'Bearer ' + token)):
+        if not current_user.is_authenticated:
+            return current_app.login_manager.unauthorized()
+        if not current_user.is_admin():
+            abort(403)
+    return Response(render_metrics(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 
 @admin.route('/user/<int:user_id>')
@@ -146,7 +328,7 @@ def link_bank_account(user_id):
     if user is None:
         abort(404)
     form = LinkBankAccount()
-    PlaidBankAccount.update_all_items()
+    request_sync()
     items = PlaidBankItem.query.filter_by(is_open=True).all()
     form.bank_item.choices = [(item.item_id, item.get_display_name()) for item in items]
     if form.validate_on_submit():
@@ -211,7 +393,7 @@ def update_editor_contents():
 @login_required
 @admin_required
 def manage_airtable():
-    site = SiteAttributes.query.all()[0]
+    site = SiteAttributes.get_settings()
     grid_form = AirtableGridHTML()
     survey_form = AirtableSurveyHTML()
     if site.form_html != '':
@@ -219,25 +401,39 @@ def manage_airtable():
     if site.grid_html != '':
         grid_form.airtable_html.data = site.grid_html
     if survey_form.validate_on_submit():
-        site.form_html = survey_form.airtable_html.raw_data[0]
-        db.session.add(site)
-        db.session.commit()
+        SiteAttributes.update(form_html=survey_form.airtable_html.raw_data[0])
     if grid_form.validate_on_submit():
-        site.grid_html = grid_form.airtable_html.raw_data[0]
-        db.session.add(site)
-        db.session.commit()
+        SiteAttributes.update(grid_html=grid_form.airtable_html.raw_data[0])
     return render_template('admin/manage_airtable.html', grid_form=grid_form, survey_form=survey_form,
-                           grid_html=site.grid_html)
+                           grid_html=SiteAttributes.get_settings().grid_html)
 
 
 @admin.route('/link-bank', methods=['GET'])
 @login_required
 @admin_required
 def link_admin_bank():
-    PlaidBankAccount.update_all_items()
+    syncing = request_sync()
     bank_accounts = PlaidBankAccount.query.all()
-    bank_items = [account.items for account in bank_accounts]
-    return render_template('admin/link_bank.html', config=Config, bank_accounts=bank_accounts, bank_items=bank_items)
+    # One query for every bank's items and their scholars
+    items = defaultdict(list)
+    for item in PlaidBankItem.query.options(
+            joinedload(PlaidBankItem.scholar)).order_by(PlaidBankItem.id):
+        items[item.admin_bank_id].append(item)
+    bank_items = [items[account.id] for account in bank_accounts]
+    return render_template('admin/link_bank.html', config=Config, bank_accounts=bank_accounts, bank_items=bank_items,
+                           last_synced=PlaidBankAccount.last_synced(), syncing=syncing)
+
+
+@admin.route('/link-bank/refresh', methods=['GET'])
+@login_required
+@admin_required
+def refresh_admin_banks():
+    """Queue a refresh of every bank's balances."""
+    if request_sync(force=True):
+        flash('Refreshing balances. Reload the page in a minute to see them.')
+    else:
+        flash('Balances are already being refreshed.')
+    return redirect(url_for('admin.link_admin_bank'))
 
 
 @admin.route('/bank/<int:bank_id>/delete-account', methods=['GET'])
@@ -13,3 +13,11 @@ vendor_js = Bundle(
     'vendor/zxcvbn.js',
     filters='jsmin',
     output='scripts/vendor.js')
+
+# Every bundle, by the name templates refer to it with
+BUNDLES = {
+    'app_css': app_css,
+    'app_js': app_js,
+    'vendor_css': vendor_css,
+    'vendor_js': vendor_js,
+}
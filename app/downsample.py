@@ -0,0 +1,43 @@
+"""
+Downsampling of time series for charts.
+"""
+
+
+def lttb(points, threshold):
+    """
+    Reduce `points`, a list of (x, y) pairs sorted by x, to at most
+    `threshold` of them with the largest-triangle-three-buckets algorithm.
+    The first and last points are always kept, and from each bucket in
+    between the point forming the largest triangle with the point kept
+    before it and the average of the next bucket, which keeps the peaks and
+    troughs a chart needs to look right.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / float(threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+
+        next_end = min(int((i + 2) * every) + 1, n)
+        next_bucket = points[end:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / float(len(next_bucket))
+        avg_y = sum(p[1] for p in next_bucket) / float(len(next_bucket))
+
+        ax, ay = points[a]
+        best_area = -1
+        best = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
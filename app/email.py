@@ -1,20 +1,228 @@
-import os
+import hashlib
+import json
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
 
-from flask import render_template
+from flask import current_app
 from flask_mail import Message
+from flask_rq import get_connection, get_queue
+from redis.exceptions import RedisError
 
-from app import create_app
+from . import db, mail
+from .email_templates import render, render_many
+from .models import EmailOutbox, User
+from .worker import get_worker_app
 
-from . import mail
+logger = logging.getLogger(__name__)
+
+DRAIN_LOCK_KEY = 'email_outbox:drain_pending'
+
+
+class SMTPConnectionPool(object):
+    """
+    A small pool of open, authenticated SMTP connections. Connections are
+    handed back after use so consecutive jobs in a worker share one SMTP
+    session instead of connecting and logging in for every message.
+    """
+
+    def __init__(self, mail, size=2, max_idle=60):
+        self.mail = mail
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection, discarding it if sending fails."""
+        conn = self._checkout()
+        try:
+            yield conn
+        except Exception:
+            self._close(conn)
+            raise
+        self._checkin(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+            # Servers drop sessions that sit idle for too long, so only trust
+            # a connection that has been idle for a while after a NOOP.
+            if time.time() - released_at < self.max_idle or self._alive(conn):
+                return conn
+            self._close(conn)
+        return self.mail.connect().__enter__()
+
+    def _checkin(self, conn):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.time()))
+                return
+        self._close(conn)
+
+    @staticmethod
+    def _alive(conn):
+        if conn.host is None:
+            return True
+        try:
+            return conn.host.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError):
+            pass
+
+
+def get_smtp_pool():
+    """Return the SMTP connection pool of the current application."""
+    app = current_app._get_current_object()
+    pool = app.extensions.get('smtp_pool')
+    if pool is None:
+        pool = app.extensions.setdefault('smtp_pool', SMTPConnectionPool(
+            mail,
+            size=app.config['MAIL_POOL_SIZE'],
+            max_idle=app.config['MAIL_POOL_MAX_IDLE']))
+    return pool
+
+
+def _message(recipient, subject, body, html):
+    msg = Message(
+        current_app.config['EMAIL_SUBJECT_PREFIX'] + ' ' + subject,
+        sender=current_app.config['EMAIL_SENDER'],
+        recipients=[recipient])
+    msg.body = body
+    msg.html = html
+    return msg
+
+
+def build_message(recipient, subject, template, **kwargs):
+    """Render an email template into a message for `recipient`."""
+    return _message(recipient, subject, *render(template, **kwargs))
+
+
+def build_messages(messages):
+    """
+    Yield a message for each item of `messages`, which hold the keyword
+    arguments of `build_message`. Runs of messages with the same template
+    are rendered together.
+    """
+    for template, group in groupby(messages, key=itemgetter('template')):
+        group = list(group)
+        contexts = [
+            dict((k, v) for k, v in kwargs.items()
+                 if k not in ('recipient', 'subject', 'template'))
+            for kwargs in group
+        ]
+        for kwargs, (body, html) in zip(group,
+                                        render_many(template, contexts)):
+            yield _message(kwargs['recipient'], kwargs['subject'], body, html)
 
 
 def send_email(recipient, subject, template, **kwargs):
-    app = create_app(os.getenv('FLASK_CONFIG') or 'default')
+    app = get_worker_app()
+    with app.app_context():
+        msg = build_message(recipient, subject, template, **kwargs)
+        with get_smtp_pool().connection() as conn:
+            conn.send(msg)
+
+
+def queue_email(recipient, subject, template, user=None, key=None,
+                **kwargs):
+    """
+    Add a transactional email to the outbox (see `EmailOutbox.queue`,
+    which commits the session) and have a worker send it. Returns whether
+    it was added, rather than dropped as a repeat of one just added.
+    """
+    if EmailOutbox.queue(recipient, subject, template, user=user, key=key,
+                         **kwargs) is None:
+        return False
+    _request_drain()
+    return True
+
+
+def queue_bulk_email(messages):
+    """
+    Add many emails to the outbox in one transaction, to be sent after any
+    transactional ones that are due. Each item of `messages` holds the
+    keyword arguments of one `queue_email` call. Returns the number added.
+    """
+    added = EmailOutbox.queue_many(messages)
+    if added:
+        _request_drain()
+    return added
+
+
+def _request_drain():
+    try:
+        # One drain at a time is queued; the scheduled drain every minute
+        # sends anything left behind if Redis is briefly unavailable
+        if get_connection().set(DRAIN_LOCK_KEY, '1', nx=True,
+                                ex=current_app.config['OUTBOX_LEASE']):
+            get_queue('high').enqueue(drain_outbox)
+    except RedisError:
+        logger.warning('Could not queue a drain of the email outbox')
+
+
+def drain_outbox():
+    """Send every email in the outbox that is due, in batches of
+    `OUTBOX_BATCH_SIZE`."""
+    app = get_worker_app()
     with app.app_context():
-        msg = Message(
-            app.config['EMAIL_SUBJECT_PREFIX'] + ' ' + subject,
-            sender=app.config['EMAIL_SENDER'],
-            recipients=[recipient])
-        msg.body = render_template(template + '.txt', **kwargs)
-        msg.html = render_template(template + '.html', **kwargs)
-        mail.send(msg)
+        try:
+            get_connection().delete(DRAIN_LOCK_KEY)
+        except RedisError:
+            pass
+        while send_outbox_batch(app.config['OUTBOX_BATCH_SIZE']):
+            pass
+
+
+def send_outbox_batch(limit):
+    """
+    Send a batch of due emails over one SMTP session, recording each one's
+    outcome as it goes. Returns the number of emails attempted.
+    """
+    emails = EmailOutbox.claim(limit)
+    user_ids = set(e.user_id for e in emails if e.user_id is not None)
+    users = dict((u.id, u) for u in User.query.filter(
+        User.id.in_(user_ids))) if user_ids else {}
+    pool = get_smtp_pool()
+    domain = current_app.config['MAIL_SERVER'] or 'localhost'
+    for email in emails:
+        try:
+            msg = build_message(email.recipient, email.subject,
+                                email.template, user=users.get(email.user_id),
+                                **json.loads(email.context))
+            # The same Message-ID on every attempt lets mail servers drop a
+            # copy resent after a drainer died between sending and recording
+            msg.msgId = '<{}@{}>'.format(
+                hashlib.sha1('{}:{}'.format(
+                    email.idempotency_key, email.id).encode('utf-8'))
+                .hexdigest(), domain)
+            with pool.connection() as conn:
+                conn.send(msg)
+        except Exception as e:
+            logger.exception('Could not send email %s', email.id)
+            email.mark_failed('{}: {}'.format(type(e).__name__, e))
+        else:
+            email.mark_sent()
+        db.session.commit()
+    return len(emails)
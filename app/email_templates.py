@@ -0,0 +1,45 @@
+"""
+Rendering of the `account/email/*` templates outside of requests.
+
+Workers compile every email template once when they start (`precompile`),
+loading them from the bytecode cache (see `app.template_cache`) if they were
+compiled before.
+`render_many` renders one template for many recipients, looking up the
+templates and running the context processors once for all of them.
+"""
+from flask import current_app
+
+from .template_cache import compile_templates
+
+EMAIL_TEMPLATES = 'account/email/'
+
+
+def precompile(app):
+    """Compile every email template of `app` into its template cache,
+    returning the number compiled."""
+    compiled, errors = compile_templates(app, EMAIL_TEMPLATES)
+    if errors:
+        raise errors[0][1]
+    return len(compiled)
+
+
+def render_many(template, contexts):
+    """
+    Render the `.txt` and `.html` versions of `template` with each of
+    `contexts`, yielding (text, html) pairs. Like `render_template`, the
+    values in each context take precedence over the context processors'.
+    """
+    app = current_app._get_current_object()
+    text = app.jinja_env.get_template(template + '.txt')
+    html = app.jinja_env.get_template(template + '.html')
+    shared = {}
+    app.update_template_context(shared)
+    for context in contexts:
+        values = dict(shared)
+        values.update(context)
+        yield text.render(values), html.render(values)
+
+
+def render(template, **context):
+    """The (text, html) versions of `template` rendered with `context`."""
+    return next(render_many(template, [context]))
@@ -0,0 +1,92 @@
+"""
+Queue wait, run time, failure and retry statistics of RQ jobs, kept in
+Redis by the worker (see `InstrumentedWorker`) and read back by
+`manage.py queue_stats` and the admin queues page.
+"""
+from collections import defaultdict
+
+from rq import Queue
+
+COUNTS_KEY = 'job_stats:counts'
+SAMPLES_KEY = 'job_stats:{}:{}:{}'
+ATTEMPTS_KEY = 'job_stats:attempts:{}'
+
+# Recent timings kept per queue, job function and measure for percentiles
+SAMPLE_SIZE = 1000
+# Seconds a job's attempt count is kept, to tell retries from first runs
+ATTEMPTS_TTL = 7 * 24 * 60 * 60
+
+MEASURES = ('wait', 'run')
+PERCENTILES = (50, 95, 99)
+
+
+def begin_attempt(connection, job_id):
+    """Count an attempt at running a job, returning which attempt it is."""
+    key = ATTEMPTS_KEY.format(job_id)
+    pipe = connection.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, ATTEMPTS_TTL)
+    return pipe.execute()[0]
+
+
+def record_job(connection, queue, func, wait, run, succeeded, attempt):
+    """Record one run of a job of `func` from `queue`, which waited `wait`
+    seconds to start and took `run` seconds."""
+    labels = '{}|{}'.format(queue, func)
+    pipe = connection.pipeline()
+    pipe.hincrby(COUNTS_KEY,
+                 labels + ('|succeeded' if succeeded else '|failed'), 1)
+    if attempt > 1:
+        pipe.hincrby(COUNTS_KEY, labels + '|retried', 1)
+    for measure, seconds in (('wait', wait), ('run', run)):
+        key = SAMPLES_KEY.format(measure, queue, func)
+        pipe.lpush(key, '{:.6f}'.format(seconds))
+        pipe.ltrim(key, 0, SAMPLE_SIZE - 1)
+    pipe.execute()
+
+
+def percentile(values, p):
+    """The `p`th percentile of sorted `values`, by the nearest rank."""
+    if not values:
+        return None
+    rank = int(round(p / 100.0 * len(values))) - 1
+    rank = max(0, min(len(values) - 1, rank))
+    return values[rank]
+
+
+def queue_stats(connection):
+    """
+    Return, for every queue, its name, depth and a list of per-function
+    stats: succeeded, failed and retried counts, and percentiles of recent
+    queue wait and run times in seconds.
+    """
+    counts = defaultdict(lambda: defaultdict(dict))
+    for field, value in connection.hgetall(COUNTS_KEY).items():
+        queue, func, outcome = field.decode('utf-8').split('|')
+        counts[queue][func][outcome] = int(value)
+
+    # Includes the failed queue once any job has failed
+    queues = dict((q.name, q) for q in Queue.all(connection=connection))
+    stats = []
+    for name in sorted(set(queues) | set(counts)):
+        queue = queues.get(name) or Queue(name, connection=connection)
+        functions = []
+        for func, outcomes in sorted(counts[name].items()):
+            row = {
+                'func': func,
+                'succeeded': outcomes.get('succeeded', 0),
+                'failed': outcomes.get('failed', 0),
+                'retried': outcomes.get('retried', 0),
+            }
+            for measure in MEASURES:
+                samples = sorted(float(s) for s in connection.lrange(
+                    SAMPLES_KEY.format(measure, name, func), 0, -1))
+                for p in PERCENTILES:
+                    row['{}_p{}'.format(measure, p)] = percentile(samples, p)
+            functions.append(row)
+        stats.append({
+            'name': name,
+            'depth': queue.count,
+            'functions': functions,
+        })
+    return stats
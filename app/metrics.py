@@ -0,0 +1,198 @@
+"""
+Request latency, response size and in-flight request metrics, in the
+Prometheus text format.
+
+Each process counts its requests in memory and adds them to shared totals
+in Redis every `METRICS_FLUSH_INTERVAL` seconds, so recording a request
+costs a few dictionary updates and the totals cover every gunicorn worker.
+"""
+import os
+import socket
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app, g, request
+from flask_rq import get_connection
+from redis.exceptions import RedisError
+
+METRICS_KEY = 'metrics:requests'
+IN_FLIGHT_KEY = 'metrics:in_flight'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Each histogram's help text, buckets and field prefix in Redis
+HISTOGRAMS = (
+    ('http_request_duration_seconds', 'Request latency by endpoint.',
+     LATENCY_BUCKETS, 'latency'),
+    ('http_response_size_bytes', 'Response body size by endpoint.',
+     SIZE_BUCKETS, 'size'),
+)
+
+_process_id = '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def _bucket(buckets, value):
+    for le in buckets:
+        if value <= le:
+            return repr(le)
+    return '+Inf'
+
+
+class _Recorder(object):
+    """This process's counts since they were last added to Redis."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = Counter()
+        self.in_flight = 0
+        self.flushed_at = time.time()
+
+    def start(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def finish(self, endpoint, method, status, seconds, size):
+        labels = '{}|{}'.format(endpoint, method)
+        with self.lock:
+            self.in_flight -= 1
+            values = self.values
+            values['requests|{}|{}'.format(labels, status)] += 1
+            values['latency_bucket|{}|{}'.format(
+                labels, _bucket(LATENCY_BUCKETS, seconds))] += 1
+            values['latency_sum|' + labels] += seconds
+            values['latency_count|' + labels] += 1
+            if size is not None:
+                values['size_bucket|{}|{}'.format(
+                    labels, _bucket(SIZE_BUCKETS, size))] += 1
+                values['size_sum|' + labels] += size
+                values['size_count|' + labels] += 1
+
+    def flush(self, interval):
+        """Add the counts to Redis if `interval` seconds have passed since
+        they last were, keeping them here if Redis can't be reached."""
+        now = time.time()
+        if now - self.flushed_at < interval:
+            return
+        with self.lock:
+            if now - self.flushed_at < interval:
+                return
+            values, self.values = self.values, Counter()
+            in_flight = self.in_flight
+            self.flushed_at = now
+        try:
+            pipe = get_connection().pipeline(transaction=False)
+            for field, value in values.items():
+                if isinstance(value, float):
+                    pipe.hincrbyfloat(METRICS_KEY, field, value)
+                else:
+                    pipe.hincrby(METRICS_KEY, field, value)
+            pipe.hset(IN_FLIGHT_KEY, _process_id,
+                      '{}:{}'.format(in_flight, now))
+            pipe.execute()
+        except RedisError:
+            with self.lock:
+                self.values.update(values)
+
+
+_recorder = _Recorder()
+
+
+def init_metrics(app):
+    """Record the latency and response size of every request to `app`."""
+
+    @app.before_request
+    def start_request_timer():
+        g._metrics_started = time.time()
+        _recorder.start()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            _recorder.finish(request.endpoint or 'unmatched', request.method,
+                             response.status_code, time.time() - started,
+                             response.content_length)
+        return response
+
+    @app.teardown_request
+    def record_failed_request(exc):
+        # Requests that raised never reach after_request
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            _recorder.finish(request.endpoint or 'unmatched', request.method,
+                             500, time.time() - started, None)
+        _recorder.flush(app.config['METRICS_FLUSH_INTERVAL'])
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(name, _escape(str(value)))
+                          for name, value in sorted(labels.items())) + '}'
+
+
+def _totals():
+    """The counts of every process: those in Redis plus this process's
+    unflushed ones, and the number of requests in flight."""
+    values = Counter()
+    in_flight = {}
+    try:
+        redis = get_connection()
+        for field, value in redis.hgetall(METRICS_KEY).items():
+            values[field.decode('utf-8')] += float(value)
+        # Processes that haven't reported recently have probably exited
+        stale = time.time() - max(
+            3 * current_app.config['METRICS_FLUSH_INTERVAL'], 60)
+        for process, value in redis.hgetall(IN_FLIGHT_KEY).items():
+            count, seen = value.decode('utf-8').split(':')
+            if float(seen) > stale:
+                in_flight[process.decode('utf-8')] = int(count)
+    except RedisError:
+        pass
+    with _recorder.lock:
+        values.update(_recorder.values)
+        in_flight[_process_id] = _recorder.in_flight
+    return values, sum(in_flight.values())
+
+
+def render_metrics():
+    """Every process's metrics in the Prometheus text format."""
+    values, in_flight = _totals()
+    grouped = defaultdict(dict)
+    for field, value in values.items():
+        kind, rest = field.split('|', 1)
+        grouped[kind][rest] = value
+
+    lines = []
+    for name, help_text, buckets, prefix in HISTOGRAMS:
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} histogram'.format(name))
+        for labels, count in sorted(grouped[prefix + '_count'].items()):
+            endpoint, method = labels.split('|')
+            cumulative = 0
+            for le in [repr(b) for b in buckets] + ['+Inf']:
+                cumulative += grouped[prefix + '_bucket'].get(
+                    '{}|{}'.format(labels, le), 0)
+                lines.append('{}_bucket{} {}'.format(name, _labels(
+                    endpoint=endpoint, method=method, le=le), int(cumulative)))
+            label_text = _labels(endpoint=endpoint, method=method)
+            lines.append('{}_sum{} {!r}'.format(
+                name, label_text, grouped[prefix + '_sum'].get(labels, 0.0)))
+            lines.append('{}_count{} {}'.format(name, label_text, int(count)))
+
+    lines.append('# HELP http_requests_total Requests by endpoint and status.')
+    lines.append('# TYPE http_requests_total counter')
+    for labels, count in sorted(grouped['requests'].items()):
+        endpoint, method, status = labels.split('|')
+        lines.append('http_requests_total{} {}'.format(_labels(
+            endpoint=endpoint, method=method, status=status), int(count)))
+
+    lines.append('# HELP http_requests_in_flight Requests being served.')
+    lines.append('# TYPE http_requests_in_flight gauge')
+    lines.append('http_requests_in_flight {}'.format(in_flight))
+    return '\n'.join(lines) + '\n'
@@ -6,3 +6,4 @@ module (as opposed to just their python files)
 from .user import *  # noqa
 from .savingsHistory import *
 from .miscellaneous import *  # noqa
+from .outbox import *  # noqa
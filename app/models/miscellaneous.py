@@ -1,3 +1,12 @@
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_rq import get_connection
+from redis.exceptions import RedisError
+
 from .. import db
 from config import Config
 import plaid
@@ -24,6 +33,16 @@ class PhoneNumberState(db.Model):
     verification_code = db.Column(db.Integer)
 
 
+SiteSettings = namedtuple(
+    'SiteSettings', ['savings_goal', 'num_modules', 'grid_html', 'form_html'])
+
+
+class _SiteSettingsCache(object):
+    settings = None
+    version = None
+    checked_at = 0
+
+
 class SiteAttributes(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     grid_html = db.Column(db.Text, default=str())
@@ -31,13 +50,81 @@ class SiteAttributes(db.Model):
     savings_goal = db.Column(db.Integer, default=int(Config.INIT_SAVINGS_GOAL))
     num_modules = db.Column(db.Integer, default=int(Config.INIT_NUM_MODULES))
 
+    # Redis counter bumped whenever the settings change, so every process
+    # knows to drop its cached copy
+    VERSION_KEY = 'site_attributes:version'
+
+    @staticmethod
+    def get_settings():
+        """
+        Return the site settings as a `SiteSettings`. They are loaded once
+        per process and reloaded only after `invalidate_cache` is called,
+        which other processes notice within
+        `SITE_ATTRIBUTES_CHECK_INTERVAL` seconds.
+        """
+        cache = _SiteSettingsCache
+        now = time.time()
+        interval = current_app.config['SITE_ATTRIBUTES_CHECK_INTERVAL']
+        if cache.settings is not None and now - cache.checked_at < interval:
+            return cache.settings
+        version = SiteAttributes._shared_version()
+        if cache.settings is None or version != cache.version:
+            # Often called while a new user is being built, which must not
+            # be flushed half done
+            with db.session.no_autoflush:
+                site = SiteAttributes.query.order_by(SiteAttributes.id).first()
+            if site is None:
+                return SiteSettings(
+                    savings_goal=int(Config.INIT_SAVINGS_GOAL),
+                    num_modules=int(Config.INIT_NUM_MODULES),
+                    grid_html='',
+                    form_html='')
+            cache.settings = SiteSettings(
+                savings_goal=site.savings_goal,
+                num_modules=site.num_modules,
+                grid_html=site.grid_html,
+                form_html=site.form_html)
+            cache.version = version
+        cache.checked_at = now
+        return cache.settings
+
+    @staticmethod
+    def update(**fields):
+        """Save new values for the site settings."""
+        site = SiteAttributes.query.order_by(SiteAttributes.id).first()
+        if site is None:
+            site = SiteAttributes()
+        for name, value in fields.items():
+            setattr(site, name, value)
+        db.session.add(site)
+        db.session.commit()
+        SiteAttributes.invalidate_cache()
+
+    @staticmethod
+    def invalidate_cache():
+        """Make every process reload the site settings."""
+        _SiteSettingsCache.settings = None
+        try:
+            get_connection().incr(SiteAttributes.VERSION_KEY)
+        except RedisError:
+            current_app.logger.warning(
+                'Could not reach Redis; other processes will keep their '
+                'cached site settings')
+
+    @staticmethod
+    def _shared_version():
+        try:
+            return get_connection().get(SiteAttributes.VERSION_KEY)
+        except RedisError:
+            return None
+
     @staticmethod
     def get_savings_goal():
-        return SiteAttributes.query.all()[0].savings_goal
+        return SiteAttributes.get_settings().savings_goal
 
     @staticmethod
     def get_num_modules():
-        return SiteAttributes.query.all()[0].num_modules
+        return SiteAttributes.get_settings().num_modules
 
 
 class PlaidBankAccount(db.Model):
@@ -46,13 +133,28 @@ class PlaidBankAccount(db.Model):
     item_id = db.Column(db.Integer)
     name = db.Column(db.String, default="Unnamed")
     access_token = db.Column(db.String)
+    last_synced_at = db.Column(db.DateTime)
     items = db.relationship('PlaidBankItem', backref='admin_bank', lazy='dynamic')
 
-    def update_items(self):
-        db_items = {item.item_id:item for item in self.items}
-        request_items = self.get_plaid_client().Auth.get(self.access_token)
+    def fetch_accounts(self, timeout=None):
+        """Ask Plaid for the accounts behind this bank login."""
+        return PlaidBankAccount._fetch_accounts(self.access_token, timeout)
+
+    @staticmethod
+    def _fetch_accounts(access_token, timeout=None):
+        client = PlaidBankAccount.get_plaid_client(timeout)
+        return client.Auth.get(access_token)['accounts']
+
+    def apply_accounts(self, accounts, db_items=None):
+        """
+        Upsert this bank's items from a Plaid account list without
+        committing. `db_items` maps item ids to this bank's existing items
+        when they have already been loaded.
+        """
+        if db_items is None:
+            db_items = {item.item_id: item for item in self.items}
         request_item_ids = set()
-        for item in request_items['accounts']:
+        for item in accounts:
             item_id = item['account_id']
             request_item_ids.add(item_id)
             balance = item['balances']['available'] if item['balances']['available'] else item['balances']['current']
@@ -61,24 +163,98 @@ class PlaidBankAccount(db.Model):
                 db.session.add(db_items[item_id])
             else:
                 new_item = PlaidBankItem(item_id=item_id, official_name=item['official_name'],
-                                         subtype=item['subtype'], mask=item['mask'], balance=balance)
+                                         subtype=item['subtype'],
+                                         mask=item['mask'], balance=balance,
+                                         admin_bank=self)
                 db.session.add(new_item)
-                self.items.append(new_item)
         closed_items = [item for item_id, item in db_items.items() if item_id not in request_item_ids]
         for closed_item in closed_items:
             closed_item.is_open = False
             db.session.add(closed_item)
+        self.last_synced_at = datetime.utcnow()
+        db.session.add(self)
+
+    def update_items(self):
+        self.apply_accounts(self.fetch_accounts())
+        db.session.commit()
+
+    @staticmethod
+    def update_all_items(max_workers=None, timeout=None):
+        """
+        Refresh every bank. The Plaid requests run concurrently on a bounded
+        thread pool, each giving up after `timeout` seconds without an
+        answer; banks whose request fails or doesn't finish in time are
+        skipped and keep their old balances. The answers that did arrive are
+        then applied and committed in a single transaction.
+
+        Returns a dict of bank id to the exception that stopped its refresh.
+        """
+        config = current_app.config
+        max_workers = max_workers or config['PLAID_SYNC_WORKERS']
+        timeout = timeout or config['PLAID_SYNC_TIMEOUT']
+        banks = PlaidBankAccount.query.all()
+        if not banks:
+            return {}
+
+        db_items = defaultdict(dict)
+        for item in PlaidBankItem.query.filter(
+                PlaidBankItem.admin_bank_id.in_([bank.id for bank in banks])):
+            db_items[item.admin_bank_id][item.item_id] = item
+
+        # Worker threads only talk to Plaid; everything touching the
+        # session stays on this thread. Requests queue behind the pool, so
+        # the last one can start `rounds` timeouts in.
+        workers = min(max_workers, len(banks))
+        rounds = -(-len(banks) // workers)
+        errors = {}
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = dict((pool.submit(PlaidBankAccount._fetch_accounts,
+                                        bank.access_token, timeout), bank)
+                           for bank in banks)
+            done, not_done = wait(futures, timeout=timeout * rounds)
+        finally:
+            pool.shutdown(wait=False)
+
+        for future in not_done:
+            future.cancel()
+            errors[futures[future].id] = TimeoutError(
+                'No answer from Plaid after {} seconds'.format(timeout))
+        for future in done:
+            bank = futures[future]
+            if future.exception() is not None:
+                errors[bank.id] = future.exception()
+            else:
+                bank.apply_accounts(future.result(), db_items[bank.id])
         db.session.commit()
 
+        for bank_id, error in errors.items():
+            current_app.logger.warning(
+                'Could not refresh bank {}: {!r}'.format(bank_id, error))
+        return errors
+
+    @staticmethod
+    def needs_sync(ttl):
+        """Whether any bank's balances are more than `ttl` seconds old."""
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        stale = PlaidBankAccount.query.filter(db.or_(
+            PlaidBankAccount.last_synced_at.is_(None),
+            PlaidBankAccount.last_synced_at < cutoff))
+        return db.session.query(stale.exists()).scalar()
+
     @staticmethod
-    def update_all_items():
-        for bank in PlaidBankAccount.query.all():
-            bank.update_items()
+    def last_synced():
+        """When the least recently synced bank was last synced."""
+        return db.session.query(db.func.min(
+            PlaidBankAccount.last_synced_at)).scalar()
 
     @staticmethod
-    def get_plaid_client():
+    def get_plaid_client(timeout=None):
+        """A Plaid client whose requests give up after `timeout` seconds
+        (`PLAID_SYNC_TIMEOUT` by default) without an answer."""
         return plaid.Client(client_id=Config.PLAID_CLIENT_ID, secret=Config.PLAID_SECRET,
-                            public_key=Config.PLAID_PUBLIC_KEY, environment=Config.PLAID_ENV)
+                            public_key=Config.PLAID_PUBLIC_KEY, environment=Config.PLAID_ENV,
+                            timeout=timeout or Config.PLAID_SYNC_TIMEOUT)
 
 
 class PlaidBankItem(db.Model):
@@ -0,0 +1,216 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_rq import get_connection
+from redis.exceptions import RedisError
+
+from .. import db
+
+DEDUP_KEY = 'email_outbox:key:{}'
+
+
+class OutboxStatus:
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+
+class OutboxPriority:
+    """Due emails are sent in this order, so a password reset never waits
+    behind a cohort's invites."""
+    TRANSACTIONAL = 0
+    BULK = 1
+
+
+class EmailOutbox(db.Model):
+    """
+    A transactional email waiting to be sent, or the record of one that
+    was. Rows hold only the user's id and the template's other (JSON)
+    arguments, and are sent by `app.email.drain_outbox`.
+    """
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status',
+                 'next_attempt_at'),
+        db.Index('ix_email_outbox_idempotency_key_created_at',
+                 'idempotency_key', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(128), nullable=False)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), index=True)
+    recipient = db.Column(db.String(254), nullable=False)
+    subject = db.Column(db.String(256), nullable=False)
+    template = db.Column(db.String(128), nullable=False)
+    context = db.Column(db.Text, nullable=False, default='{}')
+    priority = db.Column(
+        db.SmallInteger, nullable=False, default=OutboxPriority.TRANSACTIONAL)
+    status = db.Column(
+        db.String(16), nullable=False, default=OutboxStatus.PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    @staticmethod
+    def queue(recipient, subject, template, user=None, key=None, **context):
+        """
+        Add an email to the outbox and commit, unless one with the same
+        `key` was added within the last `OUTBOX_DEDUP_WINDOW` seconds (as
+        with a double-clicked button). Without a `key`, only identical
+        emails count as the same. Returns the new row, or None for a
+        duplicate.
+        """
+        email = EmailOutbox._build(recipient, subject, template, user, key,
+                                   context)
+        if not EmailOutbox._claim_keys([email.idempotency_key]):
+            return None
+        EmailOutbox._commit([email])
+        return email
+
+    @staticmethod
+    def queue_many(messages, priority=OutboxPriority.BULK):
+        """
+        Add an email for each item of `messages`, which hold the arguments
+        of `queue`, and commit them together, skipping duplicates as
+        `queue` does. Returns the number added.
+        """
+        emails = []
+        for kwargs in messages:
+            kwargs = dict(kwargs)
+            emails.append(EmailOutbox._build(
+                kwargs.pop('recipient'), kwargs.pop('subject'),
+                kwargs.pop('template'), kwargs.pop('user', None),
+                kwargs.pop('key', None), kwargs, priority))
+        claimed = EmailOutbox._claim_keys(
+            [email.idempotency_key for email in emails])
+        added = []
+        for email in emails:
+            if email.idempotency_key in claimed:
+                claimed.remove(email.idempotency_key)
+                added.append(email)
+        EmailOutbox._commit(added)
+        return len(added)
+
+    @staticmethod
+    def _build(recipient, subject, template, user, key, context,
+               priority=OutboxPriority.TRANSACTIONAL):
+        user_id = user.id if user is not None else None
+        encoded = json.dumps(context, sort_keys=True)
+        if key is None:
+            key = hashlib.sha1(json.dumps(
+                [recipient, subject, template, user_id, encoded]).encode(
+                    'utf-8')).hexdigest()
+        return EmailOutbox(
+            idempotency_key=key,
+            user_id=user_id,
+            recipient=recipient,
+            subject=subject,
+            template=template,
+            context=encoded,
+            priority=priority)
+
+    @staticmethod
+    def _claim_keys(keys):
+        """
+        Return those of `keys` not used within the last
+        `OUTBOX_DEDUP_WINDOW` seconds, claiming them for the window. Each
+        claim is a single Redis SET NX, so of two concurrent callers only
+        one gets a key. Without Redis, the outbox itself is checked, which
+        concurrent callers can both pass.
+        """
+        window = current_app.config['OUTBOX_DEDUP_WINDOW']
+        keys = list(set(keys))
+        if window <= 0 or not keys:
+            return set(keys)
+        try:
+            pipe = get_connection().pipeline(transaction=False)
+            for key in keys:
+                pipe.set(DEDUP_KEY.format(key), '1', nx=True, ex=window)
+            return set(key for key, claimed in zip(keys, pipe.execute())
+                       if claimed)
+        except RedisError:
+            current_app.logger.warning(
+                'Could not reach Redis to deduplicate outbox emails')
+            return set(keys) - EmailOutbox._recent_keys(keys)
+
+    @staticmethod
+    def _commit(emails):
+        """Add and commit `emails`, giving up their keys' claims if the
+        commit fails so that a retry isn't taken for a duplicate."""
+        db.session.add_all(emails)
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            try:
+                get_connection().delete(*[
+                    DEDUP_KEY.format(email.idempotency_key)
+                    for email in emails])
+            except RedisError:
+                pass
+            raise
+
+    @staticmethod
+    def _recent_keys(keys):
+        """Those of `keys` used within the last `OUTBOX_DEDUP_WINDOW`
+        seconds."""
+        since = datetime.utcnow() - timedelta(
+            seconds=current_app.config['OUTBOX_DEDUP_WINDOW'])
+        return set(key for key, in db.session.query(
+            EmailOutbox.idempotency_key).filter(
+                EmailOutbox.idempotency_key.in_(keys),
+                EmailOutbox.created_at >= since))
+
+    @staticmethod
+    def claim(limit):
+        """
+        Return up to `limit` emails that are due, by priority and then
+        oldest first, counting an
+        attempt at each and holding them for `OUTBOX_LEASE` seconds so
+        other drainers pass them over. Emails whose drainer dies before
+        recording the outcome are retried once that runs out.
+        """
+        now = datetime.utcnow()
+        emails = EmailOutbox.query.filter(
+            EmailOutbox.status == OutboxStatus.PENDING,
+            EmailOutbox.next_attempt_at <= now).order_by(
+                EmailOutbox.priority, EmailOutbox.id).limit(
+                    limit).with_for_update(skip_locked=True).all()
+        lease = timedelta(seconds=current_app.config['OUTBOX_LEASE'])
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt_at = now + lease
+        db.session.commit()
+        return emails
+
+    def mark_sent(self):
+        self.status = OutboxStatus.SENT
+        self.sent_at = datetime.utcnow()
+        self.last_error = None
+
+    def mark_failed(self, error):
+        """Schedule a retry after an exponentially growing delay, or give
+        up after `OUTBOX_MAX_ATTEMPTS` attempts."""
+        config = current_app.config
+        self.last_error = error
+        if self.attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+            self.status = OutboxStatus.FAILED
+            return
+        delay = config['OUTBOX_RETRY_DELAY'] * 2**(self.attempts - 1)
+        self.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    @staticmethod
+    def status_counts():
+        """The number of emails with each status."""
+        return dict(
+            db.session.query(EmailOutbox.status, db.func.count()).group_by(
+                EmailOutbox.status))
+
+    def __repr__(self):
+        return '<EmailOutbox {} to {} ({})>'.format(
+            self.template, self.recipient, self.status)
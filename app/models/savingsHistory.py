@@ -9,5 +9,53 @@ class SavingsHistory(db.Model):
     __tablename__ = 'savings_history'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    date = db.Column(db.String(64), index = True)
-    balance = db.Column(db.Integer, index = True)
+    date = db.Column(db.Date)
+    balance = db.Column(db.Integer)
+
+    # A scholar's history is always read by date, and carrying the balance
+    # in the index lets `series` be answered from the index alone
+    __table_args__ = (
+        db.Index('ix_savings_history_user_id_date', 'user_id', 'date',
+                 'balance'),
+    )
+
+    @staticmethod
+    def _in_range(query, user_id, start=None, end=None):
+        query = query.filter(SavingsHistory.user_id == user_id)
+        if start is not None:
+            query = query.filter(SavingsHistory.date >= start)
+        if end is not None:
+            query = query.filter(SavingsHistory.date <= end)
+        return query
+
+    @staticmethod
+    def for_user(user_id, start=None, end=None):
+        """A query for a user's history between `start` and `end`
+        inclusive, oldest first."""
+        return SavingsHistory._in_range(
+            SavingsHistory.query, user_id, start, end).order_by(
+                SavingsHistory.date, SavingsHistory.id)
+
+    @staticmethod
+    def series(user_id, start=None, end=None):
+        """A user's (date, balance) pairs between `start` and `end`
+        inclusive, oldest first. Entries without a date are left out."""
+        query = db.session.query(
+            SavingsHistory.date, SavingsHistory.balance).filter(
+                SavingsHistory.date.isnot(None))
+        return SavingsHistory._in_range(
+            query, user_id, start, end).order_by(
+                SavingsHistory.date, SavingsHistory.balance).all()
+
+    @staticmethod
+    def summary(user_id, start=None, end=None):
+        """The number of entries, latest date, total balance and newest id
+        of a user's dated history between `start` and `end`, which change
+        whenever an entry is added or removed."""
+        query = db.session.query(
+            db.func.count(SavingsHistory.balance),
+            db.func.max(SavingsHistory.date),
+            db.func.sum(SavingsHistory.balance),
+            db.func.max(SavingsHistory.id)).filter(
+                SavingsHistory.date.isnot(None))
+        return SavingsHistory._in_range(query, user_id, start, end).one()
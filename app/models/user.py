@@ -1,9 +1,18 @@
+import threading
+import time
+from datetime import datetime
+
 from flask import current_app
 from flask_login import AnonymousUserMixin, UserMixin
+from flask_rq import get_connection
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from itsdangerous import BadSignature, SignatureExpired
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session, joinedload
 from werkzeug.security import check_password_hash, generate_password_hash
-from sqlalchemy_utils import JSONType
 
 from .. import db, login_manager
 from .miscellaneous import SiteAttributes
@@ -49,18 +58,99 @@ class Role(db.Model):
     def __repr__(self):
         return '<Role \'%s\'>' % self.name
 
-#
-# module_associations = db.Table('module_association', db.Model.metadata, db.Column('user_id', db.Integer, db.ForeignKey('users.id')),
-#  db.Column('module_num', db.Integer, db.ForeignKey('modules.module_num'))
-# )
 
-#
-# class Module(db.Model):
-#     __tablename__ = 'modules'
-#     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
-#     certificate_url = db.Column(db.String(256), unique=True)
-#     module_num = db.Column(db.Integer, index=True, primary_key=True)
-#     filename = db.Column(db.String(256))
+class ModuleCompletion(db.Model):
+    """A scholar's certificate for one completed module. Modules are
+    numbered from 1."""
+    __tablename__ = 'module_completions'
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    module_num = db.Column(db.Integer, primary_key=True, index=True)
+    filename = db.Column(db.String(256))
+    certificate_url = db.Column(db.String(512))
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Attempts to record a completion before giving up on conflicts with
+    # concurrent writers
+    RECORD_ATTEMPTS = 5
+
+    def as_dict(self):
+        return {
+            'filename': self.filename,
+            'certificate_url': self.certificate_url,
+        }
+
+    @staticmethod
+    def _upsert(user_id, module_num, values):
+        table = ModuleCompletion.__table__
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(pg_insert(table).values(
+                user_id=user_id, module_num=module_num,
+                **values).on_conflict_do_update(
+                    index_elements=[table.c.user_id, table.c.module_num],
+                    set_=values))
+        else:
+            # SQLite runs one writer at a time, so nothing can come between
+            # the insert and the update of the same transaction
+            db.session.execute(table.insert().prefix_with('OR IGNORE').values(
+                user_id=user_id, module_num=module_num))
+            db.session.execute(table.update().where(db.and_(
+                table.c.user_id == user_id,
+                table.c.module_num == module_num)).values(**values))
+
+    @staticmethod
+    def record(user_id, module_num, filename, certificate_url):
+        """
+        Record the certificate for a user's module, replacing any earlier
+        one, and commit. The row is written in place rather than read and
+        written back, so concurrent uploads for other modules or the same
+        one are never lost; a write that conflicts with another (a lock
+        timeout, or a racing insert) is retried with backoff.
+        """
+        values = {
+            'filename': filename,
+            'certificate_url': certificate_url,
+            'completed_at': datetime.utcnow(),
+        }
+        for attempt in range(ModuleCompletion.RECORD_ATTEMPTS):
+            try:
+                ModuleCompletion._upsert(user_id, module_num, values)
+                db.session.commit()
+                return
+            except (IntegrityError, OperationalError):
+                db.session.rollback()
+                if attempt == ModuleCompletion.RECORD_ATTEMPTS - 1:
+                    raise
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+    @staticmethod
+    def completion_counts():
+        """The number of scholars who completed each module, by module
+        number."""
+        return dict(db.session.query(
+            ModuleCompletion.module_num,
+            db.func.count(ModuleCompletion.user_id)).group_by(
+                ModuleCompletion.module_num))
+
+    @staticmethod
+    def completed_per_scholar():
+        """How many scholars completed each number of modules, for scholars
+        who completed at least one."""
+        per_user = db.session.query(
+            db.func.count(ModuleCompletion.module_num).label('completed')
+        ).group_by(ModuleCompletion.user_id).subquery()
+        return dict(db.session.query(
+            per_user.c.completed, db.func.count()).group_by(
+                per_user.c.completed))
+
+    @staticmethod
+    def scholars_completed(module_num):
+        """A query for (user, completion) pairs of the users who completed
+        `module_num`, earliest first."""
+        return db.session.query(User, ModuleCompletion).join(
+            ModuleCompletion).filter(
+            ModuleCompletion.module_num == module_num).order_by(
+                ModuleCompletion.completed_at, User.id)
 
 
 class Transactions(db.Model):
@@ -98,7 +188,11 @@ class User(UserMixin, db.Model):
     savings_start_date = db.Column(db.Date)
     savings_end_date = db.Column(db.Date)
     goal_amount = db.Column(db.Integer)
-    modules = db.Column(JSONType)
+    completions = db.relationship(
+        'ModuleCompletion',
+        backref='user',
+        order_by=ModuleCompletion.module_num,
+        cascade='all, delete-orphan')
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -110,12 +204,27 @@ class User(UserMixin, db.Model):
                 self.role = Role.query.filter_by(default=True).first()
         self.savings_start_date = None
         self.savings_end_date = None
-        self.goal_amount = SiteAttributes.get_savings_goal()
-        self.modules = [None for k in range(1, SiteAttributes.get_num_modules()+1)]
+        self.goal_amount = SiteAttributes.get_settings().savings_goal
 
     def full_name(self):
         return '%s %s' % (self.first_name, self.last_name)
 
+    @property
+    def modules(self):
+        """One entry per module, in order: the certificate of a completed
+        module as a dict, or None."""
+        done = dict((c.module_num, c) for c in self.completions)
+        count = max([SiteAttributes.get_settings().num_modules] + list(done))
+        return [done[n].as_dict() if n in done else None
+                for n in range(1, count + 1)]
+
+    def complete_module(self, module_num, filename, certificate_url):
+        """Record the certificate for a module, replacing any earlier one,
+        and commit."""
+        ModuleCompletion.record(self.id, module_num, filename,
+                                certificate_url)
+        db.session.expire(self, ['completions'])
+
     def can(self, permissions):
         return self.role is not None and \
             (self.role.permissions & permissions) == permissions
@@ -143,6 +252,12 @@ class User(UserMixin, db.Model):
         s = Serializer(current_app.config['SECRET_KEY'], expiration)
         return s.dumps({'confirm': self.id})
 
+    @staticmethod
+    def generate_confirmation_tokens(users, expiration=604800):
+        """Generate confirmation tokens for many new users at once."""
+        s = Serializer(current_app.config['SECRET_KEY'], expiration)
+        return [s.dumps({'confirm': user.id}) for user in users]
+
     def generate_email_change_token(self, new_email, expiration=3600):
         """Generate an email change token to email an existing user."""
         s = Serializer(current_app.config['SECRET_KEY'], expiration)
@@ -234,10 +349,105 @@ class User(UserMixin, db.Model):
             except IntegrityError:
                 db.session.rollback()
 
+    # Redis counters bumped whenever a user changes, so every process knows
+    # to drop its cached copy
+    VERSION_KEY = 'user_identity:{}'
+    VERSION_KEY_EXPIRY = 24 * 60 * 60
+
+    @staticmethod
+    def load_identity(user_id):
+        """
+        Return the user with `user_id`, and their role, in the current
+        session. A copy of each user loaded is kept per process for
+        `USER_CACHE_TTL` seconds and reused while the user's version stamp
+        in Redis is unchanged, so most requests load the logged in user
+        without a query.
+        """
+        current = db.session.identity_map.get(
+            db.session.identity_key(User, user_id))
+        # Never overwrite changes the session hasn't saved yet
+        if current is not None and db.session.is_modified(current):
+            return current
+        version = User._identity_version(user_id)
+        with _IdentityCache.lock:
+            cached = _IdentityCache.users.get(user_id)
+        if cached is not None and cached[1] == version and \
+                time.time() - cached[0] < current_app.config['USER_CACHE_TTL']:
+            return db.session.merge(cached[2], load=False)
+
+        # Load the copy to keep in a session of its own, so it is never
+        # expired or changed and the current session's objects stay put
+        session = db.session.session_factory()
+        try:
+            user = session.query(User).options(joinedload(User.role)).get(
+                user_id)
+        finally:
+            session.close()
+        if user is None:
+            return None
+        with _IdentityCache.lock:
+            _IdentityCache.users[user_id] = (time.time(), version, user)
+        # Give the request its own copy
+        return db.session.merge(user, load=False)
+
+    @staticmethod
+    def invalidate_identities(user_ids):
+        """Make every process reload these users on their next request."""
+        with _IdentityCache.lock:
+            for user_id in user_ids:
+                _IdentityCache.users.pop(user_id, None)
+        try:
+            pipe = get_connection().pipeline()
+            for user_id in user_ids:
+                key = User.VERSION_KEY.format(user_id)
+                pipe.incr(key)
+                pipe.expire(key, User.VERSION_KEY_EXPIRY)
+            pipe.execute()
+        except RedisError:
+            current_app.logger.warning(
+                'Could not reach Redis; other processes will keep their '
+                'cached copies of users %s', sorted(user_ids))
+
+    @staticmethod
+    def _identity_version(user_id):
+        try:
+            return get_connection().get(User.VERSION_KEY.format(user_id)) \
+                or b'0'
+        except RedisError:
+            return None
+
     def __repr__(self):
         return '<User \'%s\'>' % self.full_name()
 
 
+class _IdentityCache(object):
+    """(time loaded, version, detached user) by user id."""
+    lock = threading.Lock()
+    users = {}
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, user):
+    session = Session.object_session(user)
+    if session is not None:
+        session.info.setdefault('changed_users', set()).add(user.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    # Only once the change is visible, so no process can cache the old row
+    # under the new version
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        User.invalidate_identities(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_users', None)
+
+
 class AnonymousUser(AnonymousUserMixin):
     def can(self, _):
         return False
@@ -251,4 +461,4 @@ login_manager.anonymous_user = AnonymousUser
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return User.load_identity(int(user_id))
@@ -0,0 +1,44 @@
+"""
+Keeps the cached Plaid balances fresh from the task queue, so admin pages
+never wait on Plaid.
+"""
+from flask import current_app
+from flask_rq import get_connection, get_queue
+from redis.exceptions import RedisError
+
+from .models import PlaidBankAccount
+from .worker import get_worker_app
+
+SYNC_LOCK_KEY = 'plaid_sync:pending'
+
+
+def sync_bank_balances():
+    """Refresh the balances of every linked bank."""
+    app = get_worker_app()
+    with app.app_context():
+        try:
+            PlaidBankAccount.update_all_items()
+        finally:
+            get_connection().delete(SYNC_LOCK_KEY)
+
+
+def request_sync(force=False):
+    """
+    Queue a balance refresh if the cached balances are older than
+    `PLAID_SYNC_TTL` seconds (or always, with `force`). At most one refresh
+    is queued at a time. Returns whether a refresh was queued; if Redis
+    can't be reached, none is and the cached balances are served as they
+    are.
+    """
+    ttl = current_app.config['PLAID_SYNC_TTL']
+    if not force and not PlaidBankAccount.needs_sync(ttl):
+        return False
+    try:
+        if not get_connection().set(SYNC_LOCK_KEY, '1', nx=True, ex=ttl):
+            return False
+        get_queue('low').enqueue(sync_bank_balances)
+    except RedisError:
+        current_app.logger.warning(
+            'Could not reach Redis to queue a bank balance refresh')
+        return False
+    return True
@@ -0,0 +1,89 @@
+"""
+Weekly reminders to scholars who have fallen behind their savings plan.
+
+Scholars are found in batches of `REMINDER_BATCH_SIZE` by
+`behind_schedule`, and every batch goes out over one SMTP session. The
+last user id of each finished batch is checkpointed in Redis, and each
+recipient is added to the week's sent set as their email goes out, so a
+job that crashes picks up where it stopped without emailing anyone twice.
+A recipient the mail server refuses is logged and added to the week's
+failed set instead, and the rest of the batch still goes out.
+"""
+import datetime
+import logging
+import smtplib
+
+from flask import current_app
+from flask_rq import get_connection
+
+from .email import build_messages, get_smtp_pool
+from .savings_plan import behind_schedule
+from .worker import get_worker_app
+
+CHECKPOINT_KEY = 'reminders:checkpoint:{}'
+SENT_KEY = 'reminders:sent:{}'
+FAILED_KEY = 'reminders:failed:{}'
+
+# Seconds a week's checkpoint, sent and failed sets are kept
+RUN_TTL = 14 * 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def send_savings_reminders(as_of=None):
+    """Email every scholar who is behind their plan, once per week."""
+    app = get_worker_app()
+    with app.app_context():
+        return send_reminders(as_of or datetime.date.today())
+
+
+def send_reminders(as_of):
+    """
+    Email the scholars who are behind on `as_of` and haven't been reminded
+    (or refused) yet in its week. Returns the number of emails sent.
+    """
+    redis = get_connection()
+    week = (as_of - datetime.timedelta(days=as_of.weekday())).isoformat()
+    checkpoint_key = CHECKPOINT_KEY.format(week)
+    sent_key = SENT_KEY.format(week)
+    failed_key = FAILED_KEY.format(week)
+    batch_size = current_app.config['REMINDER_BATCH_SIZE']
+
+    checkpoint = redis.get(checkpoint_key)
+    after_id = int(checkpoint) if checkpoint is not None else None
+    sent = 0
+    while True:
+        scholars = behind_schedule(as_of, after_id=after_id, limit=batch_size)
+        if not scholars:
+            break
+        pipe = redis.pipeline()
+        for scholar in scholars:
+            pipe.sismember(sent_key, scholar.user_id)
+            pipe.sismember(failed_key, scholar.user_id)
+        handled = pipe.execute()
+
+        unsent = [s for s, sent_to, failed in zip(
+            scholars, handled[::2], handled[1::2]) if not (sent_to or failed)]
+        messages = build_messages(
+            dict(recipient=scholar.email,
+                 subject='Your Savings Plan',
+                 template='account/email/savings_reminder',
+                 scholar=scholar) for scholar in unsent)
+        with get_smtp_pool().connection() as conn:
+            for scholar, msg in zip(unsent, messages):
+                try:
+                    conn.send(msg)
+                except (smtplib.SMTPRecipientsRefused,
+                        smtplib.SMTPResponseException) as e:
+                    logger.warning('Could not send a savings reminder to '
+                                   'user %s: %r', scholar.user_id, e)
+                    redis.sadd(failed_key, scholar.user_id)
+                    redis.expire(failed_key, RUN_TTL)
+                    continue
+                redis.sadd(sent_key, scholar.user_id)
+                redis.expire(sent_key, RUN_TTL)
+                sent += 1
+
+        after_id = scholars[-1].user_id
+        redis.set(checkpoint_key, after_id, ex=RUN_TTL)
+    return sent
@@ -0,0 +1,208 @@
+"""
+Weekly savings plans and how scholars are tracking against them.
+
+A scholar saves `goal_amount` in equal weekly amounts over the weeks from
+the Monday of their savings start date to the Monday of their end date.
+Plans for the whole cohort are computed together with NumPy.
+"""
+import datetime
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from . import db
+from .models import PlaidBankItem, SavingsHistory, Stage, User
+
+ScholarProgress = namedtuple('ScholarProgress', [
+    'user_id', 'name', 'email', 'weeks', 'weeks_elapsed', 'expected',
+    'actual', 'behind'])
+
+BehindScholar = namedtuple('BehindScholar', [
+    'user_id', 'first_name', 'last_name', 'email', 'expected', 'actual'])
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def _mondays(days):
+    # 1970-01-01, day 0, was a Thursday
+    return days - ((days.astype('int64') + 3) % 7).astype('timedelta64[D]')
+
+
+def weekly_plans(starts, ends, goals):
+    """
+    Return the first Monday, number of weeks and weekly amount of the plan
+    for each scholar, given sequences of their start dates, end dates and
+    goals. Plans that end before they start have no weeks.
+    """
+    starts = _mondays(np.asarray(starts, dtype='datetime64[D]'))
+    ends = _mondays(np.asarray(ends, dtype='datetime64[D]'))
+    weeks = np.maximum((ends - starts).astype('int64') // 7, 0)
+    goals = np.asarray(goals, dtype='float64')
+    increments = np.where(weeks > 0, goals / np.maximum(weeks, 1), 0.0)
+    return starts, weeks, increments
+
+
+def schedule(start, end, goal):
+    """The cumulative balance a scholar should have at the end of each
+    week of their plan."""
+    _, weeks, increments = weekly_plans([start], [end], [goal or 0])
+    return np.round(increments[0] * np.arange(1, weeks[0] + 1), 2).tolist()
+
+
+class _ScheduleCache(object):
+    """Each user's schedule along with the dates and goal it was computed
+    from, so that changing any of them invalidates it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schedules = {}
+
+    def get(self, user):
+        key = (user.savings_start_date, user.savings_end_date,
+               user.goal_amount)
+        with self._lock:
+            cached = self._schedules.get(user.id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        weeks = schedule(*key)
+        with self._lock:
+            self._schedules[user.id] = (key, weeks)
+        return weeks
+
+
+_schedules = _ScheduleCache()
+
+
+def schedule_for(user):
+    """The user's weekly schedule, or None until they have chosen their
+    savings dates."""
+    if user.savings_start_date is None or user.savings_end_date is None:
+        return None
+    return _schedules.get(user)
+
+
+def _latest_balance_query():
+    latest = db.session.query(
+        SavingsHistory.user_id,
+        db.func.max(SavingsHistory.date).label('date')).group_by(
+            SavingsHistory.user_id).subquery()
+    return db.session.query(
+        SavingsHistory.user_id,
+        db.func.max(SavingsHistory.balance).label('balance')).join(
+            latest, db.and_(SavingsHistory.user_id == latest.c.user_id,
+                            SavingsHistory.date == latest.c.date)).group_by(
+                SavingsHistory.user_id)
+
+
+def _latest_balances():
+    """Each scholar's most recent recorded balance, by user id."""
+    return dict(_latest_balance_query())
+
+
+def _monday(date):
+    """The Monday on or before a date column, in days since 1970."""
+    if db.engine.dialect.name == 'postgresql':
+        days = date - db.cast(_EPOCH.isoformat(), db.Date)
+    else:
+        days = db.cast(db.func.julianday(date) - 2440587.5, db.Integer)
+    # 1970-01-01, day 0, was a Thursday
+    return days - (days + 3) % 7
+
+
+def behind_schedule(as_of=None, after_id=None, limit=None):
+    """
+    Return a `BehindScholar` for each scholar who is behind their plan on
+    `as_of` (today by default), by the same rules as `cohort_progress`,
+    in order of user id, starting after `after_id`.
+
+    The plans are worked out in SQL, so this is one query however many
+    scholars there are. Amounts are compared in whole cents.
+    """
+    as_of = as_of or datetime.date.today()
+    today = (as_of - _EPOCH).days
+    start = _monday(User.savings_start_date)
+    end = _monday(User.savings_end_date)
+    weeks = db.case([(end > start, (end - start) / 7)], else_=0)
+    elapsed = db.case(
+        [(start > today, 0), ((today - start) / 7 > weeks, weeks)],
+        else_=(today - start) / 7)
+    # The goal's share of the elapsed weeks, rounded to the nearest cent
+    expected = db.case(
+        [(weeks > 0, (db.func.coalesce(User.goal_amount, 0) * 200 * elapsed +
+                      weeks) / (2 * weeks))],
+        else_=0)
+    recorded = _latest_balance_query().subquery()
+    actual = db.func.coalesce(PlaidBankItem.balance, recorded.c.balance)
+
+    query = db.session.query(
+        User.id, User.first_name, User.last_name, User.email,
+        expected.label('expected'), actual.label('actual')).outerjoin(
+            PlaidBankItem, User.bank_item_id == PlaidBankItem.id).outerjoin(
+                recorded, recorded.c.user_id == User.id).filter(
+                    User.savings_start_date.isnot(None),
+                    User.savings_end_date.isnot(None),
+                    User.stage.op('&')(Stage.ARCHIVED) == 0,
+                    # Scholars with no balance at all are behind once
+                    # anything is due
+                    db.func.coalesce(actual, 0) * 100 < expected)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    query = query.order_by(User.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return [
+        BehindScholar(
+            user_id=row.id,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            email=row.email,
+            expected=row.expected / 100.0,
+            actual=row.actual) for row in query]
+
+
+def cohort_progress(as_of=None):
+    """
+    Return a `ScholarProgress` for every scholar with a savings plan who
+    hasn't been archived, comparing what they should have saved by `as_of`
+    (today by default) with their linked bank balance, or else their latest
+    recorded balance.
+    """
+    as_of = np.datetime64(as_of or datetime.date.today(), 'D')
+    users = db.session.query(
+        User.id, User.first_name, User.last_name, User.email,
+        User.savings_start_date, User.savings_end_date, User.goal_amount,
+        PlaidBankItem.balance).outerjoin(
+            PlaidBankItem, User.bank_item_id == PlaidBankItem.id).filter(
+                User.savings_start_date.isnot(None),
+                User.savings_end_date.isnot(None),
+                User.stage.op('&')(Stage.ARCHIVED) == 0).order_by(
+                    User.last_name, User.id).all()
+    if not users:
+        return []
+
+    starts, weeks, increments = weekly_plans(
+        [u.savings_start_date for u in users],
+        [u.savings_end_date for u in users],
+        [u.goal_amount or 0 for u in users])
+    elapsed = np.clip((as_of - starts).astype('int64') // 7, 0, weeks)
+    expected = np.round(increments * elapsed, 2)
+
+    recorded = _latest_balances()
+    actual = np.array([
+        u.balance if u.balance is not None else recorded.get(u.id, np.nan)
+        for u in users], dtype='float64')
+    # Scholars with no balance at all are behind once anything is due
+    behind = np.where(np.isnan(actual), expected > 0, actual < expected)
+
+    return [
+        ScholarProgress(
+            user_id=u.id,
+            name='{} {}'.format(u.first_name or '', u.last_name or '').strip(),
+            email=u.email,
+            weeks=int(weeks[i]),
+            weeks_elapsed=int(elapsed[i]),
+            expected=float(expected[i]),
+            actual=None if np.isnan(actual[i]) else float(actual[i]),
+            behind=bool(behind[i]))
+        for i, u in enumerate(users)]
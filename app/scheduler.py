@@ -0,0 +1,187 @@
+"""
+Recurring jobs, enqueued by the workers themselves so no external cron is
+needed.
+
+`RQ_SCHEDULE` maps each job's name to a cron spec (minute, hour, day of
+month, month and day of week, in UTC), the dotted path of the job function
+and the queue to put it on. Every worker process runs a `Scheduler` thread
+that wakes each minute and enqueues whatever is due; a Redis lock per job
+and minute makes sure only one of them does.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from redis.exceptions import RedisError
+from rq import Queue
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'scheduler:lock:{}:{}'
+STATUS_KEY = 'scheduler:status'
+
+# Seconds a tick's lock is kept, long after every worker has passed it
+LOCK_TTL = 60 * 60
+# Minutes a late scheduler thread catches up on, e.g. after a long job
+MAX_CATCH_UP = 10
+
+# Field ranges, and the day of week's Sunday also written as 7
+_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31),
+           ('month', 1, 12), ('weekday', 0, 7))
+
+
+class CronSpec(object):
+    """A five field cron spec, e.g. '*/15 9-17 * * 1-5'."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        fields = spec.split()
+        if len(fields) != len(_FIELDS):
+            raise ValueError('Cron spec {!r} needs {} fields'.format(
+                spec, len(_FIELDS)))
+        values = [
+            self._parse(field, low, high)
+            for field, (_, low, high) in zip(fields, _FIELDS)
+        ]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        # Cron's Sunday is 0 (or 7); Python's is 6
+        self.weekdays = set((d - 1) % 7 for d in weekdays)
+        # As in cron, a restricted day of month or of week matches either
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(','):
+            if '/' in part:
+                part, step = part.split('/')
+                step = int(step)
+            else:
+                step = 1
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(v) for v in part.split('-'))
+            else:
+                start = end = int(part)
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError('Invalid cron field {!r}'.format(field))
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt):
+        day = dt.day in self.days
+        weekday = dt.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def matches(self, dt):
+        return (dt.minute in self.minutes and dt.hour in self.hours
+                and dt.month in self.months and self._day_matches(dt))
+
+    def next_after(self, dt):
+        """The first minute after `dt` that matches."""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Five years covers every satisfiable spec, e.g. 29 February
+        limit = dt + timedelta(days=5 * 366)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) +
+                      timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError('Cron spec {!r} never matches'.format(self.spec))
+
+
+def parse_schedule(schedule):
+    """`RQ_SCHEDULE` as (name, `CronSpec`, function path, queue) tuples."""
+    return [(name, CronSpec(spec), func, queue)
+            for name, (spec, func, queue) in sorted(schedule.items())]
+
+
+def enqueue_due(connection, entries, minute):
+    """
+    Enqueue the jobs of `entries` due at `minute`, unless another process
+    already has. Returns the names of the jobs this call enqueued.
+    """
+    enqueued = []
+    for name, cron, func, queue in entries:
+        if not cron.matches(minute):
+            continue
+        tick = minute.strftime('%Y%m%d%H%M')
+        if not connection.set(
+                LOCK_KEY.format(name, tick), '1', nx=True, ex=LOCK_TTL):
+            continue
+        job = Queue(queue, connection=connection).enqueue(func)
+        connection.hset(STATUS_KEY, name, '{} {}'.format(
+            minute.isoformat(), job.id))
+        enqueued.append(name)
+    return enqueued
+
+
+def schedule_status(connection, schedule, now=None):
+    """
+    Every scheduled job's name, spec, function, queue, and when it last
+    ran and will next run, in UTC.
+    """
+    now = now or datetime.utcnow()
+    last_runs = dict(
+        (name.decode('utf-8'), value.decode('utf-8').split(' '))
+        for name, value in connection.hgetall(STATUS_KEY).items())
+    status = []
+    for name, cron, func, queue in parse_schedule(schedule):
+        last_run, job_id = last_runs.get(name, (None, None))
+        status.append({
+            'name': name,
+            'spec': cron.spec,
+            'func': func,
+            'queue': queue,
+            'last_run': last_run and datetime.strptime(
+                last_run, '%Y-%m-%dT%H:%M:%S'),
+            'last_job_id': job_id,
+            'next_run': cron.next_after(now),
+        })
+    return status
+
+
+class Scheduler(threading.Thread):
+    """Enqueues the jobs of `schedule` as they come due."""
+
+    def __init__(self, connection, schedule):
+        super(Scheduler, self).__init__(name='scheduler')
+        self.daemon = True
+        self.connection = connection
+        self.entries = parse_schedule(schedule)
+        self.checked = datetime.utcnow().replace(second=0, microsecond=0)
+
+    def run(self):
+        while True:
+            now = datetime.utcnow()
+            # Sleep until just past the start of the next minute
+            time.sleep(60 - now.second - now.microsecond / 1e6 + 0.5)
+            self.tick(datetime.utcnow())
+
+    def tick(self, now):
+        """Enqueue what came due since the last tick, up to `now`."""
+        now = now.replace(second=0, microsecond=0)
+        minute = max(self.checked + timedelta(minutes=1),
+                     now - timedelta(minutes=MAX_CATCH_UP - 1))
+        while minute <= now:
+            try:
+                for name in enqueue_due(self.connection, self.entries,
+                                        minute):
+                    logger.info('Enqueued scheduled job %s', name)
+            except RedisError:
+                logger.exception('Could not enqueue jobs due at %s', minute)
+                return
+            self.checked = minute
+            minute += timedelta(minutes=1)
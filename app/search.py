@@ -0,0 +1,219 @@
+"""
+Ranked search over users' first names, last names and emails.
+
+On Postgres the search runs in SQL against `pg_trgm` indexes. Other
+databases (SQLite in development) use an in-process trigram index over the
+same three fields, built on first use and kept up to date as users change.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import joinedload
+
+from . import db
+from .models import User
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'email')
+
+# Scores are trigram similarities between 0 and 1, plus this for a prefix
+# match so that "smi" ranks "Smith" above "Osmin"
+PREFIX_BONUS = 1.0
+MIN_SIMILARITY = 0.3
+
+_words = re.compile(r'[a-z0-9]+')
+
+# Trigram indexes used by the Postgres search. They are created along with
+# the users table; `manage.py create_search_indexes` adds them to an
+# existing database.
+PG_INDEX_DDL = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    'CREATE INDEX IF NOT EXISTS ix_users_{0}_trgm ON users '
+    'USING gin (lower({0}) gin_trgm_ops)'.format(field)
+    for field in SEARCH_FIELDS
+]
+
+for _statement in PG_INDEX_DDL:
+    event.listen(User.__table__, 'after_create',
+                 DDL(_statement).execute_if(dialect='postgresql'))
+
+
+def create_pg_indexes():
+    for statement in PG_INDEX_DDL:
+        db.session.execute(statement)
+    db.session.commit()
+
+
+def trigrams(text):
+    """The trigrams of each word of `text`, padded the way pg_trgm does."""
+    grams = set()
+    for word in _words.findall(text.lower()):
+        padded = '  ' + word + ' '
+        grams.update([padded[i:i + 3] for i in range(len(padded) - 2)])
+    return grams
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / float(len(a) + len(b) - shared)
+
+
+class TrigramIndex(object):
+    """
+    An in-memory index of users for prefix and trigram search. Posting
+    lists map each trigram to the ids of users with that trigram in any
+    field, and a sorted list of (field value, id) answers prefix queries.
+    """
+
+    # Only this many of the users sharing the most trigrams with a query
+    # have their exact similarity computed
+    max_candidates = 500
+
+    def __init__(self, rows=()):
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._postings = {}
+        self._prefixes = []
+        self.built_at = time.time()
+        for row in rows:
+            self._prefixes.extend(
+                (value, row[0]) for value in self._add(row[0], row[1:]))
+        self._prefixes.sort()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, user_id, *fields):
+        with self._lock:
+            self.remove(user_id)
+            for value in self._add(user_id, fields):
+                bisect.insort(self._prefixes, (value, user_id))
+
+    def _add(self, user_id, fields):
+        """Index a user's trigrams, returning the values to add to the
+        prefix list."""
+        values = tuple((value or '').lower() for value in fields)
+        grams = tuple(trigrams(value) for value in values)
+        self._docs[user_id] = (values, grams)
+        for gram in set().union(*grams):
+            self._postings.setdefault(gram, set()).add(user_id)
+        return [value for value in values if value]
+
+    def remove(self, user_id):
+        with self._lock:
+            doc = self._docs.pop(user_id, None)
+            if doc is None:
+                return
+            values, grams = doc
+            for gram in set().union(*grams):
+                self._postings[gram].discard(user_id)
+            for value in values:
+                i = bisect.bisect_left(self._prefixes, (value, user_id))
+                if i < len(self._prefixes) and \
+                        self._prefixes[i] == (value, user_id):
+                    del self._prefixes[i]
+
+    def _prefix_matches(self, query, limit):
+        matches = set()
+        i = bisect.bisect_left(self._prefixes, (query, -1))
+        while i < len(self._prefixes) and len(matches) < limit and \
+                self._prefixes[i][0].startswith(query):
+            matches.add(self._prefixes[i][1])
+            i += 1
+        return matches
+
+    def search(self, query, limit=20):
+        """Return up to `limit` (score, user id) pairs, best first."""
+        query = query.strip().lower()
+        if not query:
+            return []
+        query_grams = trigrams(query)
+        with self._lock:
+            prefixed = self._prefix_matches(query, self.max_candidates)
+            shared = Counter()
+            for gram in query_grams:
+                shared.update(self._postings.get(gram, ()))
+            candidates = prefixed.union(
+                user_id for user_id, _ in shared.most_common(
+                    self.max_candidates))
+            scored = []
+            for user_id in candidates:
+                values, grams = self._docs[user_id]
+                score = max(similarity(query_grams, g) for g in grams)
+                if user_id in prefixed:
+                    score += PREFIX_BONUS
+                if score >= MIN_SIMILARITY:
+                    scored.append((score, -user_id))
+        return [(score, -neg_id)
+                for score, neg_id in heapq.nlargest(limit, scored)]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _fallback_index():
+    global _index
+    ttl = current_app.config['SEARCH_INDEX_TTL']
+    with _index_lock:
+        if _index is None or time.time() - _index.built_at > ttl:
+            rows = db.session.query(
+                User.id, User.first_name, User.last_name,
+                User.email).yield_per(1000)
+            _index = TrigramIndex(rows)
+    return _index
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+def _index_user(mapper, connection, user):
+    if _index is not None:
+        _index.add(user.id, *(getattr(user, f) for f in SEARCH_FIELDS))
+
+
+@event.listens_for(User, 'after_delete')
+def _unindex_user(mapper, connection, user):
+    if _index is not None:
+        _index.remove(user.id)
+
+
+def _escape_like(query):
+    return query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _pg_search(query, limit):
+    query = query.strip().lower()
+    if not query:
+        return []
+    columns = [db.func.lower(getattr(User, f)) for f in SEARCH_FIELDS]
+    prefix = _escape_like(query) + '%'
+    is_prefix = db.or_(*[c.like(prefix, escape='\\') for c in columns])
+    score = db.func.greatest(
+        *[db.func.similarity(c, query) for c in columns]) + \
+        db.case([(is_prefix, PREFIX_BONUS)], else_=0.0)
+    rows = db.session.query(User.id, score.label('score')).filter(
+        db.or_(is_prefix, *[c.op('%')(query) for c in columns])).order_by(
+            score.desc(), User.id).limit(limit)
+    return [(row.score, row.id) for row in rows]
+
+
+def search_users(query, limit=20):
+    """Return up to `limit` users best matching `query`, best first, with
+    their role and bank item loaded."""
+    if db.engine.dialect.name == 'postgresql':
+        ranked = _pg_search(query, limit)
+    else:
+        ranked = _fallback_index().search(query, limit)
+    ids = [user_id for _, user_id in ranked]
+    if not ids:
+        return []
+    users = dict((user.id, user) for user in User.query.filter(
+        User.id.in_(ids)).options(
+            joinedload(User.role), joinedload(User.bank_item)))
+    return [users[user_id] for user_id in ids if user_id in users]
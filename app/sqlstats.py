@@ -0,0 +1,110 @@
+"""
+Opt-in counting of the SQL each request runs.
+
+With `SQL_STATS` on, every request logs its endpoint, number of queries and
+time spent in SQL, and optionally returns them in `X-SQL-Queries` and
+`X-SQL-Time` headers. A statement run `SQL_STATS_N_PLUS_ONE` or more times
+in one request, differing only in its parameters, is almost always a lazy
+load in a loop; it is logged as a warning, or raised as `NPlusOneError`
+when `SQL_STATS_RAISE` is on (as it is in tests).
+"""
+import re
+import time
+from collections import Counter
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_whitespace = re.compile(r'\s+')
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_placeholder = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_placeholder_list = re.compile(
+    r'\(\s*{0}(?:\s*,\s*{0})+\s*\)'.format(_placeholder))
+
+_listening = False
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def statement_shape(statement):
+    """`statement` with literals and lists of parameters collapsed, so
+    runs of the same query with different values compare equal."""
+    shape = _whitespace.sub(' ', statement).strip()
+    shape = _literals.sub('?', shape)
+    return _placeholder_list.sub('(?)', shape)
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.queries += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """The statement shapes run at least `threshold` times, with their
+        counts, most frequent first."""
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if count >= threshold]
+
+
+def _current_stats():
+    if has_app_context():
+        return getattr(g, '_sql_stats', None)
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('sql_stats_started', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = _current_stats()
+    started = conn.info.get('sql_stats_started')
+    if stats is not None and started:
+        stats.record(statement, time.time() - started.pop())
+
+
+def init_sql_stats(app):
+    """Count the SQL of each of `app`'s requests."""
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+    @app.before_request
+    def start_sql_stats():
+        g._sql_stats = RequestStats()
+
+    @app.after_request
+    def report_sql_stats(response):
+        stats = getattr(g, '_sql_stats', None)
+        if stats is None:
+            return response
+        app.logger.info('%s: %d queries in %.1fms', request.endpoint,
+                        stats.queries, stats.seconds * 1000)
+        if app.config['SQL_STATS_HEADER']:
+            response.headers['X-SQL-Queries'] = str(stats.queries)
+            response.headers['X-SQL-Time'] = '%.1fms' % (stats.seconds * 1000)
+
+        repeated = stats.repeated(app.config['SQL_STATS_N_PLUS_ONE'])
+        if repeated:
+            message = '{}: likely N+1 queries: {}'.format(
+                request.endpoint, '; '.join(
+                    '{} x {}'.format(count, shape[:200])
+                    for shape, count in repeated))
+            if app.config['SQL_STATS_RAISE']:
+                raise NPlusOneError(message)
+            app.logger.warning(message)
+        return response
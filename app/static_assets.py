@@ -0,0 +1,136 @@
+"""
+CSS and JavaScript bundles built ahead of time.
+
+`python manage.py build_assets` builds every bundle of `app.assets`, writes
+a copy named for a hash of its contents next to the usual output (so
+relative URLs inside stylesheets still resolve), gzip and brotli
+compressed versions of that copy, and a manifest of the copies in
+`BUNDLE_MANIFEST`.
+
+With a manifest present and `ASSETS_DEBUG` off, `asset_urls` reads bundle
+URLs from the manifest loaded at startup, so rendering a page never builds
+a bundle or checks file times, and the static route serves the hashed
+copies precompressed with a far-future expiry.
+"""
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory, url_for
+from webassets.exceptions import BundleError
+
+from .assets import BUNDLES
+
+# Seconds browsers may cache a hashed bundle; its URL changes with it
+HASHED_MAX_AGE = 365 * 24 * 60 * 60
+
+# Content-Encoding and file suffix of each precompressed copy, preferred
+# first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _gzip(data):
+    out = io.BytesIO()
+    # A fixed mtime keeps the output the same for the same input
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build_assets(app):
+    """
+    Build, hash and compress every bundle of `app` and write the manifest.
+    Returns the manifest and a list of (bundle name, error) for bundles
+    that could not be rebuilt, whose existing output was used instead. A
+    bundle that can't be built and was never built before raises
+    `BundleError`, and no manifest is written.
+    """
+    # Only needed to build, not to serve
+    import brotli
+
+    env = app.jinja_env.assets_environment
+    env.debug = False
+    bundles, errors = {}, []
+    for name in sorted(BUNDLES):
+        bundle = env[name]
+        path = bundle.resolve_output()
+        try:
+            bundle.build(force=True)
+        except BundleError as e:
+            # Without an earlier build there is nothing to fall back on
+            if not os.path.isfile(path):
+                raise
+            errors.append((name, e))
+        with open(path, 'rb') as f:
+            data = f.read()
+        root, ext = os.path.splitext(path)
+        hashed = '{}.{}{}'.format(root, hashlib.sha256(data).hexdigest()[:12],
+                                  ext)
+        _write(hashed, data)
+        _write(hashed + '.gz', _gzip(data))
+        _write(hashed + '.br', brotli.compress(data))
+        bundles[name] = os.path.relpath(hashed, app.static_folder).replace(
+            os.sep, '/')
+
+    manifest = {'bundles': bundles}
+    with open(app.config['BUNDLE_MANIFEST'], 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest, errors
+
+
+def load_manifest(app):
+    """The manifest written by `build_assets`, or None if there isn't one
+    or `ASSETS_DEBUG` is on."""
+    path = app.config['BUNDLE_MANIFEST']
+    if app.config.get('ASSETS_DEBUG') or not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def init_static_assets(app):
+    """Serve `app`'s bundles from the manifest, if there is one, and add the
+    `asset_urls` template global."""
+    manifest = load_manifest(app)
+    env = app.jinja_env.assets_environment
+    bundles = manifest['bundles'] if manifest is not None else None
+
+    @app.template_global()
+    def asset_urls(name):
+        """The URL of a bundle's hashed copy, or without a manifest the
+        bundle's URLs from Flask-Assets, which builds it as needed."""
+        if bundles is None:
+            return env[name].urls()
+        return [url_for('static', filename=bundles[name])]
+
+    if manifest is None:
+        return
+    hashed = frozenset(bundles.values())
+    env.auto_build = False
+
+    def static(filename):
+        if filename not in hashed:
+            return app.send_static_file(filename)
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in ENCODINGS:
+            if encoding in request.accept_encodings:
+                break
+        else:
+            encoding = suffix = None
+        response = send_from_directory(
+            app.static_folder, filename + (suffix or ''), mimetype=mimetype,
+            cache_timeout=HASHED_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static
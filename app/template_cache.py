@@ -0,0 +1,58 @@
+"""
+Compiled Jinja templates kept on disk, so a fresh process loads bytecode
+instead of parsing `layouts/base.html` and the macros again.
+
+`python manage.py precompile_templates` fills the cache at build time,
+and `create_app` points every app at it.
+"""
+import os
+
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+
+class RelocatableBytecodeCache(FileSystemBytecodeCache):
+    """
+    A bytecode cache keyed by template paths relative to `root`, rather
+    than absolute ones, so a cache built in one checkout (such as a build
+    directory) is still used once the app runs from another.
+    """
+
+    def __init__(self, root, directory=None):
+        super(RelocatableBytecodeCache, self).__init__(directory)
+        self.root = root
+
+    def get_cache_key(self, name, filename=None):
+        if filename is not None:
+            filename = os.path.relpath(filename, self.root)
+        return super(RelocatableBytecodeCache, self).get_cache_key(
+            name, filename)
+
+
+def init_template_cache(app):
+    """Keep `app`'s compiled templates in `JINJA_BYTECODE_CACHE_DIR`, or
+    Jinja's own temporary directory if that isn't set."""
+    directory = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if directory:
+        # Every process starting at once may try to create it
+        os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = RelocatableBytecodeCache(
+        os.path.dirname(app.root_path), directory)
+
+
+def compile_templates(app, prefix=''):
+    """
+    Compile every template of `app` whose name starts with `prefix` into
+    its template and bytecode caches. Returns the names compiled and a
+    list of (name, error) for templates that don't compile.
+    """
+    names = app.jinja_env.list_templates(
+        filter_func=lambda name: name.startswith(prefix))
+    compiled, errors = [], []
+    for name in names:
+        try:
+            app.jinja_env.get_template(name)
+        except TemplateSyntaxError as e:
+            errors.append((name, e))
+        else:
+            compiled.append(name)
+    return compiled, errors
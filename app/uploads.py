@@ -0,0 +1,63 @@
+"""
+Presigned uploads of scholars' certificates to S3.
+"""
+import threading
+import time
+
+import boto3
+from flask import current_app
+
+TARGET_FOLDER = 'json/'
+
+_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Return the S3 client of the current application, creating it on first
+    use. Building a client costs tens of milliseconds, and clients are safe
+    to share between threads, so each process keeps one.
+    """
+    app = current_app._get_current_object()
+    client = app.extensions.get('s3_client')
+    if client is None:
+        with _client_lock:
+            client = app.extensions.get('s3_client')
+            if client is None:
+                # boto3's default session isn't thread safe, so use our own
+                client = boto3.session.Session().client(
+                    's3', region_name=app.config['S3_REGION'])
+                app.extensions['s3_client'] = client
+    return client
+
+
+def unique_name(file_name):
+    """`file_name` with a timestamp before its extension."""
+    stem, dot, extension = file_name.rpartition('.')
+    if not dot:
+        stem, extension = extension, ''
+    return '{}{}.{}'.format(stem, str(time.time()).replace('.', '-'),
+                            extension)
+
+
+def presign_upload(file_name, file_type):
+    """
+    Return the presigned POST for uploading `file_name` to the certificates
+    folder, with the URL to post it to and the URL it will be served from.
+    """
+    config = current_app.config
+    key = TARGET_FOLDER + unique_name(file_name)
+    presigned_post = get_s3_client().generate_presigned_post(
+        Bucket=config['S3_BUCKET'],
+        Key=key,
+        Fields={'acl': 'public-read', 'Content-Type': file_type},
+        Conditions=[
+            {'acl': 'public-read'},
+            {'Content-Type': file_type}
+        ],
+        ExpiresIn=config['S3_UPLOAD_EXPIRES'])
+    return {
+        'data': presigned_post,
+        'url_upload': presigned_post['url'],
+        'url': presigned_post['url'].rstrip('/') + '/' + key,
+    }
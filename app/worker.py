@@ -0,0 +1,140 @@
+"""
+Helpers for code that runs inside the RQ worker rather than a web request.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from flask_rq import get_connection
+from redis.exceptions import RedisError
+from rq import Queue
+from rq.utils import utcnow
+from rq.worker import SimpleWorker
+
+from . import create_app, db
+from .email_templates import precompile
+from .job_stats import begin_attempt, record_job
+from .scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def init_worker_app(app):
+    """Make `app` the application shared by every job run in this process,
+    with its email templates compiled ahead of the first job."""
+    global _app
+    precompile(app)
+    _app = app
+
+
+def get_worker_app():
+    """
+    Return the application shared by every job run in this process, building
+    it on first use. Building an app sets up every extension, the asset
+    environment and the blueprints, so jobs should never do this themselves.
+    """
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                app = create_app(os.getenv('FLASK_CONFIG') or 'default')
+                precompile(app)
+                _app = app
+    return _app
+
+
+class InstrumentedWorker(SimpleWorker):
+    """
+    A worker that records how long each job waited in its queue and took
+    to run, whether it failed, and whether it was a retry, by queue and job
+    function (see `app.job_stats`).
+    """
+
+    def perform_job(self, job, queue):
+        started = time.time()
+        wait = 0.0
+        if job.enqueued_at is not None:
+            wait = max((utcnow() - job.enqueued_at).total_seconds(), 0.0)
+        try:
+            attempt = begin_attempt(self.connection, job.id)
+        except RedisError:
+            attempt = 1
+        succeeded = super(InstrumentedWorker, self).perform_job(job, queue)
+        try:
+            record_job(self.connection, queue.name, job.func_name, wait,
+                       time.time() - started, succeeded, attempt)
+        except RedisError:
+            logger.warning('Could not record stats of job %s', job.id)
+        return succeeded
+
+
+def work(app, queue_names):
+    """
+    Run jobs from `queue_names` in this process, always taking the next job
+    from the first of them that has one, and enqueue `RQ_SCHEDULE`'s jobs
+    as they come due.
+    """
+    init_worker_app(app)
+    with app.app_context():
+        # Database connections opened before a fork can't be shared with it
+        db.engine.dispose()
+        connection = get_connection()
+    if app.config['SCHEDULER_ENABLED']:
+        Scheduler(connection, app.config['RQ_SCHEDULE']).start()
+    queues = [Queue(name, connection=connection) for name in queue_names]
+    InstrumentedWorker(queues, connection=connection).work()
+
+
+def supervise(app, queue_names, count):
+    """
+    Run `count` worker processes on `queue_names`, starting a new one
+    whenever one dies, until this process is sent SIGINT or SIGTERM.
+    """
+    if count <= 1:
+        work(app, queue_names)
+        return
+
+    processes = {}
+    stopping = []
+
+    def run():
+        # Own process group, so terminal signals reach only the supervisor
+        # and each worker is told to stop exactly once, by `stop`.
+        os.setpgrp()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        work(app, queue_names)
+
+    def start(slot):
+        process = multiprocessing.Process(
+            target=run, name='rq-worker-{}'.format(slot))
+        process.start()
+        processes[slot] = process
+
+    def stop(signum, frame):
+        if stopping:
+            return
+        stopping.append(signum)
+        for process in processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for slot in range(count):
+        start(slot)
+    while not stopping:
+        time.sleep(1)
+        for slot, process in list(processes.items()):
+            if not stopping and not process.is_alive():
+                logger.warning('Worker %s exited with %s, restarting',
+                               process.name, process.exitcode)
+                start(slot)
+    for process in processes.values():
+        process.join()
@@ -0,0 +1,67 @@
+"""
+Measures a fresh app's time to its first response, from `create_app` to
+the end of the first request for each page, with an empty Jinja bytecode
+cache and with one filled by `precompile_templates`.
+
+    python -m benchmarks.cold_start -n 20
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from app import create_app
+from app.template_cache import compile_templates
+
+PAGES = ['/account/login', '/account/register']
+
+
+def first_responses(config_name, cache_dir):
+    """Seconds from creating an app to its first response, for each page."""
+    times = []
+    for url in PAGES:
+        start = time.perf_counter()
+        app = create_app(config_name)
+        app.jinja_env.bytecode_cache.directory = cache_dir
+        response = app.test_client().get(url)
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200, (url, response.status_code)
+    return times
+
+
+def run(label, config_name, trials, cache_dir=None):
+    """Time `trials` cold starts, each with an empty bytecode cache unless
+    `cache_dir` is given."""
+    totals = []
+    for _ in range(trials):
+        directory = cache_dir or tempfile.mkdtemp()
+        try:
+            totals.append(sum(first_responses(config_name, directory)))
+        finally:
+            if cache_dir is None:
+                shutil.rmtree(directory)
+    totals.sort()
+    print('{:<12} median {:>7.1f}ms  min {:>7.1f}ms for {} first '
+          'responses'.format(label, totals[len(totals) // 2] * 1000,
+                             totals[0] * 1000, len(PAGES)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--trials', type=int, default=20)
+    parser.add_argument('-c', '--config', default='testing')
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        run('no cache', args.config, args.trials)
+        app = create_app(args.config)
+        app.jinja_env.bytecode_cache.directory = cache_dir
+        compile_templates(app)
+        run('precompiled', args.config, args.trials, cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
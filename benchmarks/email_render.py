@@ -0,0 +1,89 @@
+"""
+Compares rendering invite emails one `render_template` pair at a time in a
+fresh app (the old behaviour) against `render_many` in an app whose email
+templates were precompiled, and how long a new worker takes to compile
+the email templates with and without the on-disk bytecode cache.
+
+    python -m benchmarks.email_render -n 10000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from flask import render_template
+
+from app import create_app
+from app.email_templates import precompile, render_many
+from app.template_cache import init_template_cache
+
+from .email_throughput import FakeUser
+
+TEMPLATE = 'account/email/invite'
+
+
+def contexts(count):
+    user = FakeUser()
+    return [
+        dict(user=user,
+             invite_link='http://localhost/account/join/{}/token'.format(i))
+        for i in range(count)
+    ]
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print('{:<24} {:>8.3f}s {:>10.1f} messages/s'.format(
+        label, elapsed, count / elapsed))
+
+
+def one_at_a_time(app, items):
+    with app.app_context():
+        for context in items:
+            render_template(TEMPLATE + '.txt', **context)
+            render_template(TEMPLATE + '.html', **context)
+
+
+def bulk(app, items):
+    with app.app_context():
+        for _ in render_many(TEMPLATE, items):
+            pass
+
+
+def cold_start(config_name, cache_dir):
+    app = create_app(config_name)
+    app.config['JINJA_BYTECODE_CACHE_DIR'] = cache_dir
+    init_template_cache(app)
+    start = time.perf_counter()
+    count = precompile(app)
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--messages', type=int, default=10000)
+    parser.add_argument('-c', '--config', default='testing')
+    args = parser.parse_args()
+
+    items = contexts(args.messages)
+    timed('render_template', args.messages,
+          lambda: one_at_a_time(create_app(args.config), items))
+    app = create_app(args.config)
+    precompile(app)
+    timed('precompiled render_many', args.messages, lambda: bulk(app, items))
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        count, empty = cold_start(args.config, cache_dir)
+        _, warm = cold_start(args.config, cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+    print('Compiling {} email templates: {:.1f}ms with an empty bytecode '
+          'cache, {:.1f}ms from the cache'.format(count, empty * 1000,
+                                                  warm * 1000))
+
+
+if __name__ == '__main__':
+    main()
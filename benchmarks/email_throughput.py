@@ -0,0 +1,83 @@
+"""
+Compares how many `send_email` jobs per second a worker gets through when
+every job builds its own app and SMTP connection (the old behaviour) against
+a worker-resident app with pooled SMTP connections.
+
+    python -m benchmarks.email_throughput -n 200
+"""
+import argparse
+import time
+
+from app import create_app, mail
+from app.email import build_message, send_email
+from app.worker import init_worker_app
+
+from .smtp_sink import SMTPSink
+
+
+class FakeUser(object):
+    email = 'scholar@example.com'
+
+    def full_name(self):
+        return 'Core Scholar'
+
+
+def sink_config(sink):
+    return {
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': sink.port,
+        'MAIL_USE_TLS': False,
+        'MAIL_USE_SSL': False,
+        'MAIL_USERNAME': None,
+        'MAIL_PASSWORD': None,
+        'MAIL_SUPPRESS_SEND': False,
+        'EMAIL_SENDER': 'Admin <admin@example.com>',
+    }
+
+
+def make_app(config_name, sink):
+    app = create_app(config_name)
+    app.config.update(sink_config(sink))
+    mail.init_app(app)
+    return app
+
+
+def legacy_job(config_name, sink, **kwargs):
+    app = make_app(config_name, sink)
+    with app.app_context():
+        mail.send(build_message(**kwargs))
+
+
+def run(label, job, count, sink):
+    before = dict(sink.stats)
+    start = time.perf_counter()
+    for _ in range(count):
+        job()
+    elapsed = time.perf_counter() - start
+    print('{:<10} {:>8.1f} jobs/s {:>6} SMTP connections'.format(
+        label, count / elapsed,
+        sink.stats['connections'] - before['connections']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--jobs', type=int, default=200)
+    parser.add_argument('-c', '--config', default='testing')
+    args = parser.parse_args()
+
+    email = dict(
+        recipient=FakeUser.email,
+        subject='Confirm Your Account',
+        template='account/email/confirm',
+        user=FakeUser(),
+        confirm_link='http://localhost/account/confirm-account/token')
+
+    with SMTPSink() as sink:
+        run('before', lambda: legacy_job(args.config, sink, **email),
+            args.jobs, sink)
+        init_worker_app(make_app(args.config, sink))
+        run('after', lambda: send_email(**email), args.jobs, sink)
+
+
+if __name__ == '__main__':
+    main()
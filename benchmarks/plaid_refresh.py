@@ -0,0 +1,71 @@
+"""
+Times refreshing many linked banks one after another (the old behaviour)
+against the concurrent `PlaidBankAccount.update_all_items`, using a stub
+Plaid client that sleeps to stand in for network latency.
+
+    python -m benchmarks.plaid_refresh --banks 20 --latency 0.2
+"""
+import argparse
+import time
+from unittest import mock
+
+from app import create_app, db
+from app.models import PlaidBankAccount
+
+
+class StubPlaidClient(object):
+    def __init__(self, latency, accounts_per_bank):
+        self.Auth = self
+        self.latency = latency
+        self.accounts_per_bank = accounts_per_bank
+
+    def get(self, access_token):
+        time.sleep(self.latency)
+        return {'accounts': [{
+            'account_id': '{}-{}'.format(access_token, i),
+            'official_name': 'Savings',
+            'subtype': 'savings',
+            'mask': '{:04d}'.format(i),
+            'balances': {'available': 100 + i, 'current': None},
+        } for i in range(self.accounts_per_bank)]}
+
+
+def sequential_refresh():
+    for bank in PlaidBankAccount.query.all():
+        bank.update_items()
+
+
+def timed(label, refresh):
+    start = time.perf_counter()
+    refresh()
+    print('{:<12} {:>8.3f}s'.format(label, time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--banks', type=int, default=20)
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for i in range(args.banks):
+            db.session.add(PlaidBankAccount(access_token='bank{}'.format(i)))
+        db.session.commit()
+
+        client = StubPlaidClient(args.latency, args.accounts)
+        with mock.patch.object(PlaidBankAccount, 'get_plaid_client',
+                               return_value=client):
+            timed('sequential', sequential_refresh)
+            timed('concurrent', lambda: PlaidBankAccount.update_all_items(
+                max_workers=args.workers))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
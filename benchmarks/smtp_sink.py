@@ -0,0 +1,61 @@
+"""
+A local SMTP server that accepts and discards every message, for measuring
+email throughput without touching a real mail provider.
+"""
+import socketserver
+import threading
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.count('connections')
+        self.reply('220 localhost SMTP sink')
+        in_data = False
+        for raw in self.rfile:
+            line = raw.rstrip(b'\r\n')
+            if in_data:
+                if line == b'.':
+                    in_data = False
+                    self.server.count('messages')
+                    self.reply('250 OK')
+                continue
+            command = line[:4].upper()
+            if command == b'DATA':
+                in_data = True
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """SMTP server on a background thread that counts what it receives."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        socketserver.ThreadingTCPServer.__init__(self, (host, port),
+                                                 _SinkHandler)
+        self.stats = {'connections': 0, 'messages': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
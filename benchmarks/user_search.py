@@ -0,0 +1,88 @@
+"""
+Seeds a database with fake scholars and times `search_users` over them. On
+Postgres this exercises the pg_trgm indexes; on SQLite it exercises the
+in-process trigram index (whose one-off build time is reported separately).
+
+    python -m benchmarks.user_search --users 100000
+    FLASK_CONFIG=production python -m benchmarks.user_search -c production
+
+The database of the chosen config is dropped and recreated.
+"""
+import argparse
+import random
+import time
+
+from app import create_app, db
+from app.models import User
+from app.search import search_users
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer',
+               'Michael', 'Linda', 'William', 'Elizabeth', 'David', 'Aaliyah',
+               'Deshawn', 'Xavier', 'Yolanda', 'Imani', 'Luis', 'Mei']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia',
+              'Miller', 'Davis', 'Rodriguez', 'Martinez', 'Nguyen', 'Lopez',
+              'Wilson', 'Anderson', 'Jackson', 'Okafor', 'Kowalski', 'Chen']
+SUFFIXES = ['', 'son', 'ski', 'ez', 'ton', 'berg']
+QUERIES = ['smi', 'jennifer', 'garcai', 'okafr', 'xav', 'chen', 'mei.lopez',
+           'wilsonberg', 'zzz', 'a']
+
+
+def seed(count):
+    rnd = random.Random(0)
+    rows = []
+    for i in range(count):
+        first = rnd.choice(FIRST_NAMES)
+        last = rnd.choice(LAST_NAMES) + rnd.choice(SUFFIXES)
+        rows.append({
+            'first_name': first,
+            'last_name': last,
+            'email': '{}.{}{}@example.com'.format(first, last, i).lower(),
+            'stage': 0,
+        })
+        if len(rows) == 5000:
+            db.session.execute(User.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(User.__table__.insert(), rows)
+    db.session.commit()
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--users', type=int, default=100000)
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+    parser.add_argument('-c', '--config', default='testing')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(args.users)
+        print('{} users on {}'.format(args.users, db.engine.dialect.name))
+
+        start = time.perf_counter()
+        search_users(QUERIES[0])
+        print('first search (builds any index): {:.1f} ms'.format(
+            (time.perf_counter() - start) * 1000))
+
+        for query in QUERIES:
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = search_users(query)
+                samples.append((time.perf_counter() - start) * 1000)
+            print('{:<12} p50 {:>7.2f} ms  p95 {:>7.2f} ms  {} results'.format(
+                query, percentile(samples, 0.5), percentile(samples, 0.95),
+                len(results)))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -36,17 +36,85 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
+    # Open SMTP connections each worker keeps around between jobs, and how
+    # long (in seconds) one may sit idle before it is checked with a NOOP
+    MAIL_POOL_SIZE = int(os.environ.get('MAIL_POOL_SIZE') or 2)
+    MAIL_POOL_MAX_IDLE = int(os.environ.get('MAIL_POOL_MAX_IDLE') or 60)
     TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
     TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
 
+    # Transactional email outbox (see app/models/outbox.py): emails sent per
+    # batch, and seconds a drainer may hold a batch before other drainers
+    # may retry it
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE') or 50)
+    OUTBOX_LEASE = int(os.environ.get('OUTBOX_LEASE') or 300)
+    # Failed sends are retried after OUTBOX_RETRY_DELAY seconds, doubling
+    # each time, and given up on after OUTBOX_MAX_ATTEMPTS attempts
+    OUTBOX_RETRY_DELAY = int(os.environ.get('OUTBOX_RETRY_DELAY') or 30)
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS') or 8)
+    # Seconds after an email within which another with the same idempotency
+    # key is a repeat, e.g. from a double-clicked button
+    OUTBOX_DEDUP_WINDOW = int(os.environ.get('OUTBOX_DEDUP_WINDOW') or 10)
+
     PLAID_CLIENT_ID = os.environ.get('PLAID_CLIENT_ID')
     PLAID_SECRET = os.environ.get('PLAID_SECRET')
     PLAID_PUBLIC_KEY = os.environ.get('PLAID_PUBLIC_KEY')
     PLAID_ENV = os.environ.get('PLAID_ENV', 'sandbox')
+    # Seconds cached bank balances are served before a refresh is queued
+    PLAID_SYNC_TTL = int(os.environ.get('PLAID_SYNC_TTL') or 15 * 60)
+    # Banks refreshed at once, and seconds each Plaid request may go without
+    # an answer
+    PLAID_SYNC_WORKERS = int(os.environ.get('PLAID_SYNC_WORKERS') or 8)
+    PLAID_SYNC_TIMEOUT = int(os.environ.get('PLAID_SYNC_TIMEOUT') or 30)
+
+    # Certificate uploads go straight from the browser to this bucket
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_REGION = os.environ.get('S3_REGION') or 'us-west-2'
+    # Seconds a presigned upload stays valid, and files signed per request
+    S3_UPLOAD_EXPIRES = int(os.environ.get('S3_UPLOAD_EXPIRES') or 6000)
+    S3_SIGN_BATCH_LIMIT = int(os.environ.get('S3_SIGN_BATCH_LIMIT') or 10)
 
     INIT_SAVINGS_GOAL = os.environ.get('INIT_SAVINGS_GOAL', 500)
     INIT_NUM_MODULES = os.environ.get('INIT_NUM_MODULES', 8)
+    # Seconds a process trusts its cached site settings before checking
+    # whether an admin has changed them
+    SITE_ATTRIBUTES_CHECK_INTERVAL = int(
+        os.environ.get('SITE_ATTRIBUTES_CHECK_INTERVAL') or 5)
+    # Log the number of queries and SQL time of every request, and flag
+    # statements repeated SQL_STATS_N_PLUS_ONE times in one request (see
+    # app/sqlstats.py). SQL_STATS_HEADER also returns the counts in
+    # X-SQL-Queries and X-SQL-Time headers.
+    SQL_STATS = os.environ.get('SQL_STATS', 'False') == 'True'
+    SQL_STATS_HEADER = os.environ.get('SQL_STATS_HEADER', 'False') == 'True'
+    SQL_STATS_N_PLUS_ONE = int(os.environ.get('SQL_STATS_N_PLUS_ONE') or 10)
+    SQL_STATS_RAISE = False
+
+    # Request metrics (see app/metrics.py): seconds between each process
+    # adding its counts to the totals in Redis, and a token that lets a
+    # Prometheus scraper read /admin/metrics without logging in
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+    METRICS_FLUSH_INTERVAL = int(
+        os.environ.get('METRICS_FLUSH_INTERVAL') or 10)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Seconds a process reuses a logged in user (and their role) loaded by
+    # an earlier request, unless the user has changed since
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+
+    # Seconds before the in-process user search index (used when the
+    # database is not Postgres) is rebuilt to pick up other processes' edits
+    SEARCH_INDEX_TTL = int(os.environ.get('SEARCH_INDEX_TTL') or 300)
+
+    # Directory of compiled Jinja templates, filled at build time by
+    # `manage.py precompile_templates` and shared by every process
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get(
+        'JINJA_BYTECODE_CACHE_DIR') or os.path.join(basedir, '.jinja_cache')
+
+    # Manifest of the hashed, precompressed CSS and JavaScript bundles
+    # written by `manage.py build_assets` (see app/static_assets.py)
+    BUNDLE_MANIFEST = os.environ.get('BUNDLE_MANIFEST') or os.path.join(
+        basedir, 'app', 'static', 'manifest.json')
 
     # Analytics
     GOOGLE_ANALYTICS_ID = os.environ.get('GOOGLE_ANALYTICS_ID') or ''
@@ -77,6 +145,25 @@ class Config:
     RQ_DEFAULT_PASSWORD = url.password
     RQ_DEFAULT_DB = 0
 
+    # Queues run_worker listens on, highest priority first: 'high' holds
+    # transactional email, 'low' bulk email and bank syncs
+    RQ_QUEUES = (os.environ.get('RQ_QUEUES') or 'high,default,low').split(',')
+    # Worker processes run_worker keeps running
+    RQ_WORKERS = int(os.environ.get('RQ_WORKERS') or 2)
+
+    # Recurring jobs every worker process checks for each minute:
+    # name -> (cron spec in UTC, job function, queue)
+    RQ_SCHEDULE = {
+        'plaid_sync': ('0 */6 * * *', 'app.plaid_sync.sync_bank_balances',
+                       'low'),
+        'savings_reminders': ('0 15 * * 1',
+                              'app.reminders.send_savings_reminders', 'low'),
+        'email_outbox': ('* * * * *', 'app.email.drain_outbox', 'high'),
+    }
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'True') == 'True'
+    # Scholars emailed per query and SMTP session by the savings reminders
+    REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE') or 200)
+
     @staticmethod
     def init_app(app):
         pass
@@ -92,6 +179,10 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    SQL_STATS = True
+    SQL_STATS_HEADER = True
+    # Fail any request that looks like it runs N+1 queries
+    SQL_STATS_RAISE = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-test.sqlite')
     WTF_CSRF_ENABLED = False
@@ -3,13 +3,17 @@ import os
 import subprocess
 from config import Config
 
-from flask_migrate import Migrate, MigrateCommand
+from flask_migrate import Migrate, MigrateCommand, stamp
 from flask_script import Manager, Shell
 from redis import Redis
-from rq import Connection, Queue, Worker
 
 from app import create_app, db
-from app.models import Role, User, SiteAttributes, Stage
+from app.models import Role, User, SiteAttributes, Stage, PlaidBankAccount
+from app.job_stats import PERCENTILES, queue_stats as get_queue_stats
+from app.scheduler import schedule_status
+from app.static_assets import build_assets as build_static_assets
+from app.template_cache import compile_templates
+from app.worker import supervise
 
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
@@ -43,6 +47,18 @@ def recreate_db():
     db.drop_all()
     db.create_all()
     db.session.commit()
+    # The new tables already match the latest migration
+    stamp()
+
+
+@manager.command
+def create_search_indexes():
+    """Adds the trigram indexes used by user search to a Postgres database."""
+    from app.search import create_pg_indexes
+    if db.engine.dialect.name != 'postgresql':
+        print('User search only uses database indexes on Postgres.')
+        return
+    create_pg_indexes()
 
 
 @manager.option(
@@ -89,21 +105,89 @@ def setup_general():
             db.session.add(user)
             print('Added administrator {}'.format(user.full_name()))
     db.session.commit()
+    SiteAttributes.invalidate_cache()
+
+
+@manager.command
+def sync_banks():
+    """Refreshes the cached balances of every linked bank from Plaid."""
+    PlaidBankAccount.update_all_items()
+
+
+@manager.option(
+    '-q',
+    '--queues',
+    help='Comma separated queues to listen on, highest priority first')
+@manager.option('-w', '--workers', type=int, help='Number of worker processes')
+def run_worker(queues=None, workers=None):
+    """
+    Runs rq workers on the `RQ_QUEUES` queues, taking jobs from the first
+    queue that has any. With more than one worker, a supervisor process
+    keeps that many running. Jobs run in the worker processes against the
+    app built above, so they share its extensions and SMTP connections.
+    """
+    listen = queues.split(',') if queues else app.config['RQ_QUEUES']
+    supervise(app, listen, workers or app.config['RQ_WORKERS'])
+
+
+@manager.command
+def queue_stats():
+    """Shows each queue's depth and its jobs' wait and run times."""
+    conn = Redis(
+        host=app.config['RQ_DEFAULT_HOST'],
+        port=app.config['RQ_DEFAULT_PORT'],
+        db=0,
+        password=app.config['RQ_DEFAULT_PASSWORD'])
+
+    def ms(seconds):
+        return '-' if seconds is None else '{:.0f}ms'.format(seconds * 1000)
+
+    for queue in get_queue_stats(conn):
+        print('{name}: {depth} waiting'.format(**queue))
+        for row in queue['functions']:
+            print('  {func}: {succeeded} ok, {failed} failed, '
+                  '{retried} retried'.format(**row))
+            for measure in ('wait', 'run'):
+                print('    {:<4} {}'.format(measure, '  '.join(
+                    'p{} {}'.format(p, ms(row['{}_p{}'.format(measure, p)]))
+                    for p in PERCENTILES)))
 
 
 @manager.command
-def run_worker():
-    """Initializes a slim rq task queue."""
-    listen = ['default']
+def schedule():
+    """Shows when each scheduled job last ran and will next run (UTC)."""
     conn = Redis(
         host=app.config['RQ_DEFAULT_HOST'],
         port=app.config['RQ_DEFAULT_PORT'],
         db=0,
         password=app.config['RQ_DEFAULT_PASSWORD'])
+    for job in schedule_status(conn, app.config['RQ_SCHEDULE']):
+        print('{name} ({spec}) on {queue}: last ran {last}, next {next_run}'
+              .format(last=job['last_run'] or 'never', **job))
+
+
+@manager.command
+def build_assets():
+    """Builds hashed, compressed CSS and JavaScript bundles."""
+    manifest, errors = build_static_assets(app)
+    for name, error in errors:
+        print('Could not rebuild {}, using its last build: {}'.format(
+            name, error))
+    for name, path in sorted(manifest['bundles'].items()):
+        print('{}: {}'.format(name, path))
+    print('Wrote {}'.format(app.config['BUNDLE_MANIFEST']))
+
 
-    with Connection(conn):
-        worker = Worker(map(Queue, listen))
-        worker.work()
+@manager.command
+def precompile_templates():
+    """Compiles every template into the Jinja bytecode cache."""
+    compiled, errors = compile_templates(app)
+    print('Compiled {} templates into {}'.format(
+        len(compiled), app.config['JINJA_BYTECODE_CACHE_DIR']))
+    for name, error in errors:
+        print('Could not compile {}: {}'.format(name, error))
+    if errors:
+        raise SystemExit(1)
 
 
 @manager.command
@@ -0,0 +1,54 @@
+"""Store savings history dates as dates and index them by user
+
+Revision ID: 3f1c2a9d7b4e
+Revises: 5b7e9c1d3a20
+Create Date: 2018-08-20 10:12:41.338112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b4e'
+down_revision = '5b7e9c1d3a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_savings_history_date', table_name='savings_history')
+    op.drop_index('ix_savings_history_balance', table_name='savings_history')
+    if op.get_bind().dialect.name == 'postgresql':
+        # Dates were stored as str(date); anything else can't be parsed and
+        # becomes NULL
+        op.alter_column(
+            'savings_history', 'date',
+            existing_type=sa.String(length=64), type_=sa.Date(),
+            postgresql_using="CASE WHEN date ~ '^\\d{4}-\\d{2}-\\d{2}' "
+                             "THEN substring(date from 1 for 10)::date END")
+    else:
+        # SQLite keeps dates as ISO strings, so copying the table with the
+        # new column type carries the existing values over as they are
+        with op.batch_alter_table('savings_history') as batch_op:
+            batch_op.alter_column(
+                'date', existing_type=sa.String(length=64), type_=sa.Date())
+    op.create_index('ix_savings_history_user_id_date', 'savings_history',
+                    ['user_id', 'date', 'balance'])
+
+
+def downgrade():
+    op.drop_index('ix_savings_history_user_id_date',
+                  table_name='savings_history')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column(
+            'savings_history', 'date',
+            existing_type=sa.Date(), type_=sa.String(length=64),
+            postgresql_using='date::text')
+    else:
+        with op.batch_alter_table('savings_history') as batch_op:
+            batch_op.alter_column(
+                'date', existing_type=sa.Date(), type_=sa.String(length=64))
+    op.create_index('ix_savings_history_balance', 'savings_history',
+                    ['balance'])
+    op.create_index('ix_savings_history_date', 'savings_history', ['date'])
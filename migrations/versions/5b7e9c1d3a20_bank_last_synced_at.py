@@ -0,0 +1,25 @@
+"""Record when each linked bank's balances were last synced
+
+Revision ID: 5b7e9c1d3a20
+Revises:
+Create Date: 2018-08-20 10:05:17.904415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e9c1d3a20'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('banks', sa.Column('last_synced_at', sa.DateTime()))
+
+
+def downgrade():
+    with op.batch_alter_table('banks') as batch_op:
+        batch_op.drop_column('last_synced_at')
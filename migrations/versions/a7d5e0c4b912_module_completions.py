@@ -0,0 +1,91 @@
+"""Move module certificates from users.modules into module_completions
+
+Revision ID: a7d5e0c4b912
+Revises: 3f1c2a9d7b4e
+Create Date: 2018-08-27 14:03:19.520871
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d5e0c4b912'
+down_revision = '3f1c2a9d7b4e'
+branch_labels = None
+depends_on = None
+
+users = sa.table(
+    'users',
+    sa.column('id', sa.Integer),
+    sa.column('modules', sqlalchemy_utils.JSONType))
+
+
+def _module_list(value):
+    # JSONType is json on Postgres, which the driver decodes, and text
+    # elsewhere
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value or []
+
+
+def upgrade():
+    completions = op.create_table(
+        'module_completions',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('module_num', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=256), nullable=True),
+        sa.Column('certificate_url', sa.String(length=512), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'module_num'))
+    op.create_index('ix_module_completions_module_num', 'module_completions',
+                    ['module_num'])
+
+    rows = []
+    conn = op.get_bind()
+    for user_id, modules in conn.execute(
+            sa.select([users.c.id, users.c.modules])):
+        for i, module in enumerate(_module_list(modules)):
+            if module:
+                rows.append({
+                    'user_id': user_id,
+                    'module_num': i + 1,
+                    'filename': module.get('filename'),
+                    'certificate_url': module.get('certificate_url'),
+                })
+    if rows:
+        op.bulk_insert(completions, rows)
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('modules')
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(
+            sa.Column('modules', sqlalchemy_utils.JSONType(), nullable=True))
+
+    conn = op.get_bind()
+    num_modules = conn.execute(
+        'SELECT num_modules FROM site_attributes LIMIT 1').scalar() or 0
+    modules = {}
+    for user_id, module_num, filename, certificate_url in conn.execute(
+            'SELECT user_id, module_num, filename, certificate_url '
+            'FROM module_completions'):
+        modules.setdefault(user_id, {})[module_num] = {
+            'filename': filename,
+            'certificate_url': certificate_url,
+        }
+    for (user_id,) in conn.execute(sa.select([users.c.id])):
+        done = modules.get(user_id, {})
+        count = max([num_modules] + list(done))
+        conn.execute(users.update().where(users.c.id == user_id).values(
+            modules=[done.get(n) for n in range(1, count + 1)]))
+
+    op.drop_index('ix_module_completions_module_num',
+                  table_name='module_completions')
+    op.drop_table('module_completions')
@@ -0,0 +1,52 @@
+"""Add the email_outbox table of transactional emails
+
+Revision ID: c81f3e6a2d05
+Revises: a7d5e0c4b912
+Create Date: 2018-09-04 10:21:47.118390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f3e6a2d05'
+down_revision = 'a7d5e0c4b912'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'email_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=128), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('recipient', sa.String(length=254), nullable=False),
+        sa.Column('subject', sa.String(length=256), nullable=False),
+        sa.Column('template', sa.String(length=128), nullable=False),
+        sa.Column('context', sa.Text(), nullable=False),
+        sa.Column('priority', sa.SmallInteger(), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_email_outbox_user_id', 'email_outbox', ['user_id'])
+    op.create_index('ix_email_outbox_status_next_attempt_at', 'email_outbox',
+                    ['status', 'next_attempt_at'])
+    op.create_index('ix_email_outbox_idempotency_key_created_at',
+                    'email_outbox', ['idempotency_key', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_email_outbox_idempotency_key_created_at',
+                  table_name='email_outbox')
+    op.drop_index('ix_email_outbox_status_next_attempt_at',
+                  table_name='email_outbox')
+    op.drop_index('ix_email_outbox_user_id', table_name='email_outbox')
+    op.drop_table('email_outbox')
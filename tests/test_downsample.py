@@ -0,0 +1,24 @@
+import math
+import unittest
+
+from app.downsample import lttb
+
+
+class DownsampleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.points = [(i, math.sin(i / 10.0) * 100) for i in range(1000)]
+
+    def test_keeps_ends_and_order(self):
+        sampled = lttb(self.points, 50)
+        self.assertEqual(len(sampled), 50)
+        self.assertEqual(sampled[0], self.points[0])
+        self.assertEqual(sampled[-1], self.points[-1])
+        self.assertEqual(sampled, sorted(sampled))
+
+    def test_keeps_extremes(self):
+        sampled = lttb(self.points, 100)
+        self.assertGreater(max(y for _, y in sampled), 99)
+        self.assertLess(min(y for _, y in sampled), -99)
+
+    def test_short_series_unchanged(self):
+        self.assertEqual(lttb(self.points[:10], 50), self.points[:10])
@@ -0,0 +1,48 @@
+import shutil
+import tempfile
+import unittest
+
+from flask import render_template
+
+from app import create_app
+from app.email_templates import precompile, render_many
+from app.template_cache import init_template_cache
+
+
+class FakeUser(object):
+    def full_name(self):
+        return 'Core Scholar'
+
+
+class EmailTemplatesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['JINJA_BYTECODE_CACHE_DIR'] = self.cache_dir
+        init_template_cache(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_precompile(self):
+        count = precompile(self.app)
+        self.assertEqual(count, len(self.app.jinja_env.list_templates(
+            filter_func=lambda name: name.startswith('account/email/'))))
+        self.assertTrue(count)
+
+    def test_render_many_matches_render_template(self):
+        precompile(self.app)
+        contexts = [
+            dict(user=FakeUser(),
+                 reset_link='http://localhost/reset/{}'.format(i))
+            for i in range(3)
+        ]
+        rendered = list(render_many('account/email/reset_password', contexts))
+        self.assertEqual(rendered, [
+            (render_template('account/email/reset_password.txt', **context),
+             render_template('account/email/reset_password.html', **context))
+            for context in contexts
+        ])
@@ -0,0 +1,86 @@
+import csv
+import datetime
+import io
+import unittest
+import zipfile
+
+from app import create_app, db
+from app.admin.export import export_query, stream_csv, stream_xlsx
+from app.models import Role, SavingsHistory, User
+
+FORMULA = '=HYPERLINK("http://evil.example.com","Click")'
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        for i in range(3):
+            user = User(first_name='Scholar', last_name=str(i),
+                        email='scholar{}@example.com'.format(i),
+                        bank_acct_open=datetime.date(2018, 1, 1 + i))
+            db.session.add(user)
+            db.session.flush()
+            for day in range(1, 4):
+                db.session.add(SavingsHistory(
+                    user_id=user.id, date=datetime.date(2018, 2, day),
+                    balance=100 * day))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def export_csv(self, dataset, columns, **kwargs):
+        body = ''.join(stream_csv(
+            columns, export_query(dataset, columns, **kwargs)))
+        return list(csv.reader(io.StringIO(body)))
+
+    def test_scholars(self):
+        rows = self.export_csv(
+            'scholars', ['email', 'role', 'bank_acct_open'],
+            start=datetime.date(2018, 1, 2))
+        self.assertEqual(rows, [
+            ['email', 'role', 'bank_acct_open'],
+            ['scholar1@example.com', 'User', '2018-01-02'],
+            ['scholar2@example.com', 'User', '2018-01-03'],
+        ])
+
+    def test_savings_history_date_range(self):
+        rows = self.export_csv(
+            'savings_history', ['email', 'date', 'balance'],
+            start=datetime.date(2018, 2, 2), end=datetime.date(2018, 2, 2))
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(all(row[1:] == ['2018-02-02', '200']
+                            for row in rows[1:]))
+
+    def test_rejects_unknown_columns(self):
+        with self.assertRaises(ValueError):
+            export_query('scholars', ['password_hash'])
+
+    def test_xlsx(self):
+        columns = ['email', 'bank_acct_open']
+        body = b''.join(stream_xlsx(
+            columns, export_query('scholars', columns)))
+        self.assertTrue(body.startswith(b'PK'))
+
+    def test_formulas_are_exported_as_text(self):
+        user = User.query.first()
+        user.first_name = FORMULA
+        user.last_name = '@SUM(1+1)'
+        db.session.commit()
+        columns = ['first_name', 'last_name', 'goal_amount']
+        rows = self.export_csv('scholars', columns)
+        self.assertEqual(rows[1][:2], ["'" + FORMULA, "'@SUM(1+1)"])
+
+        body = b''.join(stream_xlsx(
+            columns, export_query('scholars', columns)))
+        with zipfile.ZipFile(io.BytesIO(body)) as xlsx:
+            sheet = xlsx.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertNotIn('<f>', sheet)
+        self.assertNotIn('<hyperlink', sheet)
+        self.assertIn('=HYPERLINK(', sheet)
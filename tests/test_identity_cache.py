@@ -0,0 +1,85 @@
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Permission, Role, Stage, User
+
+
+class IdentityCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='scholar@example.com', password='password',
+                         stage=Stage.COMPLETED_EMAIL_CONF)
+        db.session.add(self.user)
+        db.session.commit()
+        self.user_id = self.user.id
+        User.invalidate_identities([self.user_id])
+        self.statements = []
+        self.engine = db.engine
+        event.listen(self.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(self.engine, 'before_cursor_execute', self.record)
+        User.invalidate_identities([self.user_id])
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def request_queries(self, client, url):
+        del self.statements[:]
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(self.statements)
+
+    def test_queries_per_authenticated_request(self):
+        # The savings series itself takes two queries
+        url = '/account/savingsHistory/series'
+        # Let each request have its own app context, and so its own session
+        self.app_context.pop()
+        try:
+            client = self.app.test_client()
+            response = client.post('/account/login', data={
+                'email': 'scholar@example.com',
+                'password': 'password'
+            })
+            self.assertEqual(response.status_code, 302)
+            # The user and their role in one query, then nothing
+            self.assertEqual(self.request_queries(client, url), 3)
+            self.assertEqual(self.request_queries(client, url), 2)
+        finally:
+            self.app_context.push()
+
+    def test_loaded_user_has_role(self):
+        user = User.load_identity(self.user_id)
+        db.session.remove()
+        del self.statements[:]
+        user = User.load_identity(self.user_id)
+        self.assertEqual(user.role.name, 'User')
+        self.assertFalse(user.is_admin())
+        self.assertEqual(self.statements, [])
+
+    def test_unsaved_changes_are_kept(self):
+        User.load_identity(self.user_id)
+        db.session.remove()
+        user = User.query.get(self.user_id)
+        user.first_name = 'Changed'
+        self.assertIs(User.load_identity(self.user_id), user)
+        self.assertEqual(user.first_name, 'Changed')
+
+    def test_changes_invalidate(self):
+        User.load_identity(self.user_id)
+        db.session.remove()
+        user = User.query.get(self.user_id)
+        user.role = Role.query.filter_by(
+            permissions=Permission.ADMINISTER).first()
+        db.session.commit()
+        db.session.remove()
+        self.assertTrue(User.load_identity(self.user_id).is_admin())
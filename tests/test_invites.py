@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+import unittest
+from unittest import mock
+
+from flask_rq import get_connection
+
+from app import create_app, db
+from app.admin import invites
+from app.admin.invites import import_invites, save_report, send_invites
+from app.models import EmailOutbox, OutboxPriority, Role, User
+from app.models.outbox import DEDUP_KEY
+
+CSV = '''first_name,last_name,email,bank_acct_open,role
+Ada,Lovelace,ada@example.com,2018-01-15,
+Alan,Turing,ALAN@example.com,,administrator
+Grace,Hopper,grace@example.com,,
+Ada,Again,Ada@Example.com,,
+Old,Account,existing@example.com,,
+No,Email,,,
+Bad,Date,bad.date@example.com,15/01/2018,
+Bad,Role,bad.role@example.com,,wizard
+'''
+
+
+class InvitesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.clear_dedup_keys()
+        db.create_all()
+        Role.insert_roles()
+        self.default_role = Role.query.filter_by(default=True).first()
+        db.session.add(User(email='existing@example.com'))
+        db.session.commit()
+
+    def tearDown(self):
+        self.clear_dedup_keys()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def clear_dedup_keys(self):
+        redis = get_connection()
+        for key in redis.scan_iter(DEDUP_KEY.format('invite:*')):
+            redis.delete(key)
+
+    def import_csv(self, text):
+        return import_invites(io.BytesIO(text.encode('utf-8')),
+                              self.default_role)
+
+    def test_imports_valid_rows_and_reports_the_rest(self):
+        result = self.import_csv(CSV)
+        self.assertEqual([user.email for user in result.users], [
+            'ada@example.com', 'alan@example.com', 'grace@example.com'
+        ])
+        users = dict((user.email, user) for user in User.query)
+        self.assertEqual(len(users), 4)
+        self.assertEqual(str(users['ada@example.com'].bank_acct_open),
+                         '2018-01-15')
+        self.assertTrue(users['alan@example.com'].is_admin())
+        self.assertEqual(users['grace@example.com'].role, self.default_role)
+
+        self.assertEqual([(e['line'], e['email'], e['error'])
+                          for e in result.errors], [
+            (5, 'ada@example.com', 'Email appears earlier in the file.'),
+            (6, 'existing@example.com', 'Email already registered.'),
+            (7, '', 'Missing email.'),
+            (8, 'bad.date@example.com',
+             'bank_acct_open must look like YYYY-MM-DD.'),
+            (9, 'bad.role@example.com', 'Unknown account type wizard.'),
+        ])
+
+    def test_missing_columns(self):
+        result = self.import_csv('first_name,email\nAda,ada@example.com\n')
+        self.assertEqual(result.users, [])
+        self.assertEqual(result.errors, [{
+            'line': 1,
+            'email': '',
+            'error': 'Missing column(s): last_name.'
+        }])
+        self.assertEqual(User.query.count(), 1)
+
+    def test_error_report(self):
+        redis = mock.Mock()
+        with mock.patch.object(invites, 'get_connection', return_value=redis):
+            report_id = save_report(self.import_csv(CSV).errors)
+        key, report = redis.set.call_args[0]
+        self.assertEqual(key, 'invite_report:' + report_id)
+        rows = list(csv.DictReader(io.StringIO(report)))
+        self.assertEqual([row['line'] for row in rows],
+                         ['5', '6', '7', '8', '9'])
+        self.assertEqual(rows[1]['error'], 'Email already registered.')
+
+    def test_invite_emails_go_to_the_outbox(self):
+        users = self.import_csv(CSV).users
+        with self.app.test_request_context(), \
+                mock.patch('app.email._request_drain') as request_drain:
+            send_invites(users)
+        request_drain.assert_called_once_with()
+        emails = EmailOutbox.query.order_by(EmailOutbox.id).all()
+        self.assertEqual([e.recipient for e in emails], [
+            'ada@example.com', 'alan@example.com', 'grace@example.com'
+        ])
+        self.assertEqual([e.idempotency_key for e in emails],
+                         ['invite:{}'.format(user.id) for user in users])
+        self.assertEqual(emails[0].user_id, users[0].id)
+        self.assertEqual(emails[0].template, 'account/email/invite')
+        self.assertTrue(all(e.priority == OutboxPriority.BULK
+                            for e in emails))
+        self.assertIn('/account/join-from-invite/{}/'.format(users[0].id),
+                      json.loads(emails[0].context)['invite_link'])
@@ -0,0 +1,102 @@
+import time
+import unittest
+from datetime import timedelta
+
+from flask_rq import get_connection
+from rq import Queue, get_failed_queue
+from rq.job import Job
+from rq.registry import FinishedJobRegistry
+from rq.utils import utcnow
+
+from app import create_app
+from app.job_stats import (ATTEMPTS_KEY, COUNTS_KEY, MEASURES, SAMPLES_KEY,
+                           percentile, queue_stats)
+from app.worker import InstrumentedWorker
+
+QUEUE = 'test_job_stats'
+
+
+def nap():
+    time.sleep(0.05)
+
+
+def fail():
+    raise ValueError('Failed on purpose')
+
+
+class JobStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.redis = get_connection()
+        self.queue = Queue(QUEUE, connection=self.redis)
+        self.job_ids = []
+        self.clear()
+
+    def tearDown(self):
+        self.clear()
+        self.app_context.pop()
+
+    def clear(self):
+        failed = get_failed_queue(connection=self.redis)
+        for job_id in self.job_ids:
+            failed.remove(job_id)
+            self.redis.delete(Job.key_for(job_id), ATTEMPTS_KEY.format(job_id))
+        self.queue.empty()
+        self.redis.delete(FinishedJobRegistry(QUEUE, self.redis).key)
+        for field in self.redis.hkeys(COUNTS_KEY):
+            if field.decode('utf-8').startswith(QUEUE + '|'):
+                self.redis.hdel(COUNTS_KEY, field)
+        for func in (nap, fail):
+            self.redis.delete(*[
+                SAMPLES_KEY.format(measure, QUEUE, func.__module__ + '.' +
+                                   func.__name__) for measure in MEASURES
+            ])
+
+    def enqueue(self, func, waited=0):
+        job = self.queue.enqueue(func)
+        job.enqueued_at = utcnow() - timedelta(seconds=waited)
+        job.save()
+        self.job_ids.append(job.id)
+        return job
+
+    def work(self):
+        InstrumentedWorker([self.queue], connection=self.redis).work(
+            burst=True)
+
+    def stats(self):
+        queues = dict((q['name'], q) for q in queue_stats(self.redis))
+        return dict((row['func'].rsplit('.', 1)[1], row)
+                    for row in queues[QUEUE]['functions'])
+
+    def test_records_wait_run_time_and_failures(self):
+        self.enqueue(nap, waited=5)
+        self.enqueue(fail)
+        self.work()
+        stats = self.stats()
+
+        self.assertEqual(stats['nap']['succeeded'], 1)
+        self.assertEqual(stats['nap']['failed'], 0)
+        self.assertGreaterEqual(stats['nap']['wait_p50'], 5)
+        self.assertGreaterEqual(stats['nap']['run_p99'], 0.05)
+        self.assertEqual(stats['fail']['succeeded'], 0)
+        self.assertEqual(stats['fail']['failed'], 1)
+        self.assertEqual(stats['fail']['retried'], 0)
+        self.assertLess(stats['fail']['wait_p50'], 5)
+
+    def test_counts_retries(self):
+        job = self.enqueue(fail)
+        self.work()
+        get_failed_queue(connection=self.redis).requeue(job.id)
+        self.work()
+        stats = self.stats()['fail']
+        self.assertEqual(stats['failed'], 2)
+        self.assertEqual(stats['retried'], 1)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([0.25], 95), 0.25)
+        self.assertIsNone(percentile([], 50))
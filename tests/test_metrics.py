@@ -0,0 +1,53 @@
+import re
+import unittest
+
+from app import create_app
+from app.metrics import render_metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['METRICS_TOKEN'] = 'scraper-token'
+        self.app.add_url_rule('/_test/hello', 'test_hello', lambda: 'hello')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def sample(self, text, name, **labels):
+        label_text = ','.join('{}="{}"'.format(k, v)
+                              for k, v in sorted(labels.items()))
+        match = re.search(r'^{}\{{{}\}} (\S+)$'.format(
+            re.escape(name), re.escape(label_text)), text, re.M)
+        return float(match.group(1)) if match else 0
+
+    def test_requests_are_recorded(self):
+        before = render_metrics()
+        client = self.app.test_client()
+        for _ in range(3):
+            client.get('/_test/hello')
+        after = render_metrics()
+        labels = {'endpoint': 'test_hello', 'method': 'GET'}
+        self.assertEqual(
+            self.sample(after, 'http_requests_total', status=200, **labels) -
+            self.sample(before, 'http_requests_total', status=200, **labels),
+            3)
+        self.assertEqual(
+            self.sample(after, 'http_request_duration_seconds_bucket',
+                        le='+Inf', **labels),
+            self.sample(after, 'http_request_duration_seconds_count',
+                        **labels))
+        self.assertGreaterEqual(
+            self.sample(after, 'http_response_size_bytes_bucket', le='256',
+                        **labels), 3)
+
+    def test_endpoint_requires_admin_or_token(self):
+        client = self.app.test_client()
+        self.assertNotEqual(client.get('/admin/metrics').status_code, 200)
+        response = client.get('/admin/metrics', headers={
+            'Authorization': 'Bearer scraper-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_request_duration_seconds histogram',
+                      response.get_data(as_text=True))
@@ -0,0 +1,119 @@
+import json
+import threading
+import unittest
+
+from app import create_app, db
+from app.models import ModuleCompletion, Role, SiteAttributes, Stage, User
+
+
+class ModuleCompletionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(SiteAttributes(num_modules=3))
+        db.session.commit()
+        SiteAttributes.invalidate_cache()
+        self.users = [User(email='scholar{}@example.com'.format(i))
+                      for i in range(3)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+    def tearDown(self):
+        SiteAttributes.invalidate_cache()
+        User.invalidate_identities([user.id for user in self.users])
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_modules(self):
+        user = self.users[0]
+        self.assertEqual(user.modules, [None, None, None])
+        user.complete_module(2, 'cert.pdf', 'https://example.com/cert.pdf')
+        db.session.commit()
+        self.assertEqual(user.modules, [None, {
+            'filename': 'cert.pdf',
+            'certificate_url': 'https://example.com/cert.pdf'}, None])
+
+    def test_replacing_a_certificate(self):
+        user = self.users[0]
+        user.complete_module(1, 'old.pdf', 'https://example.com/old.pdf')
+        db.session.commit()
+        user.complete_module(1, 'new.pdf', 'https://example.com/new.pdf')
+        db.session.commit()
+        self.assertEqual(ModuleCompletion.query.count(), 1)
+        self.assertEqual(user.modules[0]['filename'], 'new.pdf')
+
+    def test_aggregates(self):
+        for user, modules in zip(self.users, [[1, 2, 3], [1], []]):
+            for n in modules:
+                user.complete_module(n, 'cert.pdf', 'https://example.com/')
+        db.session.commit()
+        self.assertEqual(ModuleCompletion.completion_counts(),
+                         {1: 2, 2: 1, 3: 1})
+        self.assertEqual(ModuleCompletion.completed_per_scholar(),
+                         {3: 1, 1: 1})
+        completed = ModuleCompletion.scholars_completed(1).all()
+        self.assertEqual(set(u.id for u, _ in completed),
+                         set([self.users[0].id, self.users[1].id]))
+
+    def test_deleting_user_deletes_completions(self):
+        self.users[0].complete_module(1, 'cert.pdf', 'https://example.com/')
+        db.session.commit()
+        db.session.delete(self.users[0])
+        db.session.commit()
+        self.assertEqual(ModuleCompletion.query.count(), 0)
+
+    def test_concurrent_updates_are_not_lost(self):
+        # Each scholar uploads every module twice at once, as from two tabs
+        def record(user_id, module_num):
+            with self.app.app_context():
+                ModuleCompletion.record(
+                    user_id, module_num, 'cert{}.pdf'.format(module_num),
+                    'https://example.com/')
+                db.session.remove()
+
+        threads = [threading.Thread(target=record, args=(user.id, n))
+                   for user in self.users for n in (1, 2, 3)
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(ModuleCompletion.completion_counts(),
+                         {1: 3, 2: 3, 3: 3})
+        for user in self.users:
+            self.assertEqual([m['filename'] for m in user.modules],
+                             ['cert1.pdf', 'cert2.pdf', 'cert3.pdf'])
+
+    def test_update_endpoint_validates_module_number(self):
+        user = self.users[0]
+        user.password = 'password'
+        user.stage = Stage.COMPLETED_EMAIL_CONF
+        db.session.commit()
+        client = self.app.test_client()
+        response = client.post('/account/login', data={
+            'email': user.email,
+            'password': 'password'
+        })
+        self.assertEqual(response.status_code, 302)
+
+        def update(**data):
+            data.setdefault('filename', 'cert.pdf')
+            data.setdefault('certificate_url', 'https://example.com/')
+            return client.post('/account/modules-update',
+                               data={'data': json.dumps(data)}).status_code
+
+        for module_num in (-1, 3, 'one', 1.5, None, True):
+            self.assertEqual(update(module_num=module_num), 400)
+        self.assertEqual(update(), 400)
+        self.assertEqual(client.post('/account/modules-update', data={
+            'data': 'not json'}).status_code, 400)
+        self.assertEqual(ModuleCompletion.query.count(), 0)
+
+        self.assertEqual(update(module_num=2), 200)
+        self.assertEqual(update(module_num='0'), 200)
+        self.assertEqual(
+            sorted(c.module_num for c in ModuleCompletion.query), [1, 3])
@@ -0,0 +1,150 @@
+import smtplib
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask_rq import get_connection
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app import create_app, db, mail
+from app.email import send_outbox_batch
+from app.models import EmailOutbox, OutboxPriority, OutboxStatus, Role, User
+from app.models import outbox
+from app.models.outbox import DEDUP_KEY
+
+
+def clear_dedup_keys():
+    redis = get_connection()
+    for key in redis.scan_iter(DEDUP_KEY.format('*')):
+        redis.delete(key)
+
+
+class FailingPool(object):
+    def connection(self):
+        raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        clear_dedup_keys()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='scholar@example.com', first_name='Scholar')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        clear_dedup_keys()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def queue(self, **kwargs):
+        return EmailOutbox.queue(
+            recipient=self.user.email,
+            subject='Confirm Your Account',
+            template='account/email/confirm',
+            user=self.user,
+            confirm_link='http://localhost/confirm',
+            **kwargs)
+
+    def test_duplicates_are_dropped(self):
+        self.assertIsNotNone(self.queue(key='confirm:1'))
+        self.assertIsNone(self.queue(key='confirm:1'))
+        self.assertIsNotNone(self.queue(key='confirm:2'))
+        self.assertEqual(EmailOutbox.query.count(), 2)
+
+    def test_same_key_is_sent_again_after_the_window(self):
+        self.queue(key='confirm:1')
+        redis = get_connection()
+        key = DEDUP_KEY.format('confirm:1')
+        self.assertLessEqual(redis.ttl(key),
+                             self.app.config['OUTBOX_DEDUP_WINDOW'])
+        redis.delete(key)
+        self.assertIsNotNone(self.queue(key='confirm:1'))
+
+    def test_concurrent_duplicates_are_dropped(self):
+        # Two requests from a double-clicked button, queued at once
+        user_id = self.user.id
+        barrier = threading.Barrier(2)
+        queued = []
+
+        def queue():
+            with self.app.app_context():
+                user = User.query.get(user_id)
+                barrier.wait()
+                queued.append(EmailOutbox.queue(
+                    recipient=user.email, subject='Confirm Your Account',
+                    template='account/email/confirm', user=user,
+                    key='confirm:1') is not None)
+                db.session.remove()
+
+        threads = [threading.Thread(target=queue) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(queued), [False, True])
+        self.assertEqual(EmailOutbox.query.count(), 1)
+
+    def test_duplicates_are_dropped_without_redis(self):
+        redis = mock.Mock()
+        redis.pipeline.return_value.execute.side_effect = \
+            RedisConnectionError('Connection refused')
+        with mock.patch.object(outbox, 'get_connection', return_value=redis):
+            email = self.queue(key='confirm:1')
+            self.assertIsNotNone(email)
+            self.assertIsNone(self.queue(key='confirm:1'))
+            email.created_at -= timedelta(
+                seconds=self.app.config['OUTBOX_DEDUP_WINDOW'] + 1)
+            db.session.commit()
+            self.assertIsNotNone(self.queue(key='confirm:1'))
+
+    def test_bulk_email_waits_for_transactional(self):
+        added = EmailOutbox.queue_many([
+            dict(recipient='scholar{}@example.com'.format(i),
+                 subject='You Are Invited To Join',
+                 template='account/email/invite',
+                 key='invite:{}'.format(i),
+                 invite_link='http://localhost/join') for i in range(3)
+        ] + [dict(recipient='scholar0@example.com',
+                  subject='You Are Invited To Join',
+                  template='account/email/invite',
+                  key='invite:0',
+                  invite_link='http://localhost/join')])
+        self.assertEqual(added, 3)
+        self.queue(key='confirm:1')
+        emails = EmailOutbox.claim(2)
+        self.assertEqual([e.priority for e in emails],
+                         [OutboxPriority.TRANSACTIONAL, OutboxPriority.BULK])
+        self.assertEqual(emails[1].idempotency_key, 'invite:0')
+
+    def test_sends_and_records_delivery(self):
+        self.queue()
+        with mail.record_messages() as outbox:
+            self.assertEqual(send_outbox_batch(10), 1)
+            self.assertEqual(send_outbox_batch(10), 0)
+        self.assertEqual(len(outbox), 1)
+        self.assertIn('Dear Scholar', outbox[0].body)
+        email = EmailOutbox.query.one()
+        self.assertEqual(email.status, OutboxStatus.SENT)
+        self.assertEqual(email.attempts, 1)
+
+    def test_failures_back_off_then_give_up(self):
+        self.app.config['OUTBOX_MAX_ATTEMPTS'] = 2
+        self.app.extensions['smtp_pool'] = FailingPool()
+        self.queue()
+        self.assertEqual(send_outbox_batch(10), 1)
+        email = EmailOutbox.query.one()
+        self.assertEqual(email.status, OutboxStatus.PENDING)
+        self.assertIn('SMTPServerDisconnected', email.last_error)
+        # Not due again until the retry delay has passed
+        self.assertEqual(send_outbox_batch(10), 0)
+        email.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        self.assertEqual(send_outbox_batch(10), 1)
+        self.assertEqual(EmailOutbox.query.one().status, OutboxStatus.FAILED)
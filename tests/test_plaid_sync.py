@@ -0,0 +1,142 @@
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app import create_app, db
+from app import plaid_sync
+from app.models import PlaidBankAccount, PlaidBankItem
+
+
+class FakePlaidClient(object):
+    """Answers `Auth.get` from a dict of access token -> accounts."""
+
+    def __init__(self, accounts):
+        self.Auth = self
+        self.accounts = accounts
+
+    def get(self, access_token):
+        return {'accounts': self.accounts[access_token]}
+
+
+def plaid_account(account_id, available, current=None):
+    return {
+        'account_id': account_id,
+        'official_name': 'Savings ' + account_id,
+        'subtype': 'savings',
+        'mask': '0000',
+        'balances': {'available': available, 'current': current},
+    }
+
+
+class PlaidSyncTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def patch_client(self, accounts):
+        return mock.patch.object(PlaidBankAccount, 'get_plaid_client',
+                                 return_value=FakePlaidClient(accounts))
+
+    def test_update_items_records_balances_and_sync_time(self):
+        bank = PlaidBankAccount(access_token='token')
+        db.session.add(bank)
+        db.session.commit()
+        with self.patch_client({'token': [plaid_account('a', 25),
+                                          plaid_account('b', None, 40)]}):
+            PlaidBankAccount.update_all_items()
+        balances = dict((item.item_id, item.balance)
+                        for item in PlaidBankItem.query.all())
+        self.assertEqual(balances, {'a': 25, 'b': 40})
+        self.assertIsNotNone(bank.last_synced_at)
+
+    def test_closed_items_are_marked(self):
+        bank = PlaidBankAccount(access_token='token')
+        db.session.add(bank)
+        db.session.commit()
+        with self.patch_client({'token': [plaid_account('a', 25)]}):
+            bank.update_items()
+        with self.patch_client({'token': []}):
+            bank.update_items()
+        self.assertFalse(PlaidBankItem.query.one().is_open)
+
+    def test_failed_bank_does_not_block_others(self):
+        good = PlaidBankAccount(access_token='good')
+        bad = PlaidBankAccount(access_token='bad')
+        db.session.add_all([good, bad])
+        db.session.commit()
+        with self.patch_client({'good': [plaid_account('a', 25)]}):
+            errors = PlaidBankAccount.update_all_items()
+        self.assertEqual(list(errors), [bad.id])
+        self.assertEqual(PlaidBankItem.query.one().admin_bank_id, good.id)
+        self.assertIsNotNone(good.last_synced_at)
+        self.assertIsNone(bad.last_synced_at)
+
+    def test_updates_are_committed_together(self):
+        banks = [PlaidBankAccount(access_token=token)
+                 for token in ('one', 'two', 'three')]
+        db.session.add_all(banks)
+        db.session.commit()
+        with self.patch_client(dict((bank.access_token,
+                                     [plaid_account(bank.access_token, 1)])
+                                    for bank in banks)), \
+                mock.patch.object(db.session, 'commit',
+                                  wraps=db.session.commit) as commit:
+            PlaidBankAccount.update_all_items(max_workers=2)
+        commit.assert_called_once_with()
+        self.assertEqual(PlaidBankItem.query.count(), 3)
+
+    def test_unanswered_bank_times_out(self):
+        bank = PlaidBankAccount(access_token='slow')
+        db.session.add(bank)
+        db.session.commit()
+        answer = threading.Event()
+        client = mock.Mock()
+        client.Auth.get.side_effect = lambda token: answer.wait()
+        with mock.patch.object(PlaidBankAccount, 'get_plaid_client',
+                               return_value=client):
+            errors = PlaidBankAccount.update_all_items(timeout=0.1)
+        answer.set()
+        self.assertIsInstance(errors[bank.id], TimeoutError)
+        self.assertIsNone(bank.last_synced_at)
+
+    def test_each_request_has_the_sync_timeout(self):
+        self.app.config['PLAID_SYNC_TIMEOUT'] = 5
+        db.session.add(PlaidBankAccount(access_token='token'))
+        db.session.commit()
+        with self.patch_client({'token': []}) as get_plaid_client:
+            PlaidBankAccount.update_all_items()
+        get_plaid_client.assert_called_once_with(5)
+
+    def test_needs_sync(self):
+        self.assertFalse(PlaidBankAccount.needs_sync(60))
+        bank = PlaidBankAccount(access_token='token')
+        db.session.add(bank)
+        db.session.commit()
+        self.assertTrue(PlaidBankAccount.needs_sync(60))
+        bank.last_synced_at = datetime.utcnow()
+        db.session.commit()
+        self.assertFalse(PlaidBankAccount.needs_sync(60))
+        bank.last_synced_at = datetime.utcnow() - timedelta(seconds=120)
+        db.session.commit()
+        self.assertTrue(PlaidBankAccount.needs_sync(60))
+
+    def test_request_sync_without_redis(self):
+        db.session.add(PlaidBankAccount(access_token='token'))
+        db.session.commit()
+        redis = mock.Mock()
+        redis.set.side_effect = RedisConnectionError('Connection refused')
+        with mock.patch.object(plaid_sync, 'get_connection',
+                               return_value=redis), \
+                mock.patch.object(plaid_sync, 'get_queue') as get_queue:
+            self.assertFalse(plaid_sync.request_sync())
+        get_queue.assert_not_called()
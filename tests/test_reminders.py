@@ -0,0 +1,90 @@
+import datetime
+import smtplib
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from flask_rq import get_connection
+
+from app import create_app, db, mail
+from app.models import Role, User
+from app import reminders
+from app.reminders import (CHECKPOINT_KEY, FAILED_KEY, SENT_KEY,
+                           send_reminders)
+
+# A Wednesday, in the week starting 2018-01-15
+AS_OF = datetime.date(2018, 1, 17)
+WEEK = '2018-01-15'
+
+
+class RemindersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['REMINDER_BATCH_SIZE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.clear()
+        db.create_all()
+        Role.insert_roles()
+        for i in range(3):
+            user = User(email='scholar{}@example.com'.format(i),
+                        first_name='Scholar')
+            user.goal_amount = 400
+            user.savings_start_date = datetime.date(2018, 1, 3)
+            user.savings_end_date = datetime.date(2018, 1, 29)
+            db.session.add(user)
+        db.session.commit()
+        self.ids = [user.id for user in User.query.order_by(User.id)]
+
+    def tearDown(self):
+        self.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def clear(self):
+        get_connection().delete(CHECKPOINT_KEY.format(WEEK),
+                                SENT_KEY.format(WEEK), FAILED_KEY.format(WEEK))
+
+    def send(self):
+        with mail.record_messages() as outbox:
+            self.assertEqual(send_reminders(AS_OF), len(outbox))
+        return sorted(message.recipients[0] for message in outbox)
+
+    def test_reminds_once_a_week(self):
+        self.assertEqual(self.send(), [
+            'scholar0@example.com', 'scholar1@example.com',
+            'scholar2@example.com'
+        ])
+        self.assertEqual(self.send(), [])
+
+    def test_resumes_after_crash(self):
+        # Crashed after the first batch and one email of the second
+        redis = get_connection()
+        redis.set(CHECKPOINT_KEY.format(WEEK), self.ids[0])
+        redis.sadd(SENT_KEY.format(WEEK), self.ids[1])
+        self.assertEqual(self.send(), ['scholar2@example.com'])
+
+    def test_refused_recipient_does_not_stop_the_rest(self):
+        sent = []
+
+        def send(msg):
+            if msg.recipients == ['scholar1@example.com']:
+                raise smtplib.SMTPRecipientsRefused(
+                    {'scholar1@example.com': (550, b'No such user')})
+            sent.append(msg.recipients[0])
+
+        @contextmanager
+        def connection():
+            yield mock.Mock(send=send)
+
+        pool = mock.Mock(connection=connection)
+        with mock.patch.object(reminders, 'get_smtp_pool',
+                               return_value=pool):
+            self.assertEqual(send_reminders(AS_OF), 2)
+            self.assertEqual(send_reminders(AS_OF), 0)
+        self.assertEqual(sent, ['scholar0@example.com',
+                                'scholar2@example.com'])
+        redis = get_connection()
+        self.assertTrue(redis.sismember(FAILED_KEY.format(WEEK), self.ids[1]))
+        self.assertFalse(redis.sismember(SENT_KEY.format(WEEK), self.ids[1]))
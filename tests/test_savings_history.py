@@ -0,0 +1,58 @@
+import datetime
+import unittest
+
+from app import create_app, db
+from app.models import Role, SavingsHistory, User
+
+
+class SavingsHistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='scholar@example.com')
+        other = User(email='other@example.com')
+        db.session.add_all([self.user, other])
+        db.session.flush()
+        for day, balance in [(3, 30), (1, 10), (2, 20)]:
+            for user in (self.user, other):
+                db.session.add(SavingsHistory(
+                    user_id=user.id, date=datetime.date(2018, 3, day),
+                    balance=balance))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_series_is_ordered_by_date(self):
+        series = SavingsHistory.series(self.user.id)
+        self.assertEqual([balance for _, balance in series], [10, 20, 30])
+        self.assertIsInstance(series[0][0], datetime.date)
+
+    def test_range(self):
+        history = SavingsHistory.for_user(
+            self.user.id, start=datetime.date(2018, 3, 2),
+            end=datetime.date(2018, 3, 3)).all()
+        self.assertEqual([h.balance for h in history], [20, 30])
+        self.assertTrue(all(h.user_id == self.user.id for h in history))
+
+    def test_undated_entries_are_left_out(self):
+        db.session.add(SavingsHistory(user_id=self.user.id, balance=99))
+        db.session.commit()
+        self.assertEqual(len(SavingsHistory.series(self.user.id)), 3)
+        count, latest, total, _ = SavingsHistory.summary(self.user.id)
+        self.assertEqual((count, latest, total),
+                         (3, datetime.date(2018, 3, 3), 60))
+
+    def test_summary_changes_when_an_entry_is_replaced(self):
+        before = SavingsHistory.summary(self.user.id)
+        entry = SavingsHistory.for_user(self.user.id).first()
+        db.session.delete(entry)
+        db.session.add(SavingsHistory(user_id=self.user.id, date=entry.date,
+                                      balance=entry.balance))
+        db.session.commit()
+        self.assertNotEqual(SavingsHistory.summary(self.user.id), before)
@@ -0,0 +1,98 @@
+import datetime
+import unittest
+
+from app import create_app, db
+from app.models import PlaidBankItem, Role, SavingsHistory, Stage, User
+from app.savings_plan import (behind_schedule, cohort_progress, schedule,
+                              schedule_for)
+
+
+class SavingsPlanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def scholar(self, email, goal=400, **kwargs):
+        # A four week plan from Wednesday 2018-01-03 to Monday 2018-01-29
+        user = User(email=email, **kwargs)
+        user.goal_amount = goal
+        user.savings_start_date = datetime.date(2018, 1, 3)
+        user.savings_end_date = datetime.date(2018, 1, 29)
+        db.session.add(user)
+        db.session.flush()
+        return user
+
+    def test_schedule(self):
+        self.assertEqual(
+            schedule(datetime.date(2018, 1, 3), datetime.date(2018, 1, 29),
+                     400), [100.0, 200.0, 300.0, 400.0])
+        self.assertEqual(
+            schedule(datetime.date(2018, 1, 29), datetime.date(2018, 1, 3),
+                     400), [])
+
+    def test_schedule_cache_follows_goal(self):
+        user = self.scholar('scholar@example.com')
+        self.assertEqual(schedule_for(user)[-1], 400.0)
+        user.goal_amount = 800
+        self.assertEqual(schedule_for(user)[-1], 800.0)
+
+    def test_cohort_progress(self):
+        on_track = self.scholar('on-track@example.com')
+        db.session.add(SavingsHistory(user_id=on_track.id,
+                                      date=datetime.date(2018, 1, 10),
+                                      balance=50))
+        db.session.add(SavingsHistory(user_id=on_track.id,
+                                      date=datetime.date(2018, 1, 16),
+                                      balance=250))
+        self.scholar('linked@example.com',
+                     bank_item=PlaidBankItem(balance=150))
+        self.scholar('nothing@example.com')
+        db.session.commit()
+
+        progress = dict((p.email, p) for p in cohort_progress(
+            as_of=datetime.date(2018, 1, 17)))
+        self.assertEqual(progress['on-track@example.com'].expected, 200.0)
+        self.assertEqual(progress['on-track@example.com'].actual, 250.0)
+        self.assertFalse(progress['on-track@example.com'].behind)
+        self.assertTrue(progress['linked@example.com'].behind)
+        self.assertIsNone(progress['nothing@example.com'].actual)
+        self.assertTrue(progress['nothing@example.com'].behind)
+
+    def test_behind_schedule_matches_cohort_progress(self):
+        on_track = self.scholar('on-track@example.com')
+        db.session.add(SavingsHistory(user_id=on_track.id,
+                                      date=datetime.date(2018, 1, 16),
+                                      balance=250))
+        self.scholar('linked@example.com',
+                     bank_item=PlaidBankItem(balance=150))
+        self.scholar('uneven@example.com', goal=100,
+                     bank_item=PlaidBankItem(balance=49.99))
+        self.scholar('nothing@example.com')
+        self.scholar('archived@example.com', stage=Stage.ARCHIVED)
+        db.session.commit()
+
+        for as_of in (datetime.date(2018, 1, 1), datetime.date(2018, 1, 17),
+                      datetime.date(2018, 3, 1)):
+            expected = [(p.email, p.expected, p.actual)
+                        for p in sorted(cohort_progress(as_of),
+                                        key=lambda p: p.user_id)
+                        if p.behind]
+            self.assertEqual([(s.email, s.expected, s.actual)
+                              for s in behind_schedule(as_of)], expected)
+
+        self.assertNotIn('archived@example.com',
+                         [p.email for p in cohort_progress()])
+
+        behind = behind_schedule(datetime.date(2018, 1, 17))
+        self.assertEqual(
+            behind_schedule(datetime.date(2018, 1, 17),
+                            after_id=behind[0].user_id, limit=1),
+            behind[1:2])
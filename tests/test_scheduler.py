@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime
+
+from app.scheduler import CronSpec
+
+
+class CronSpecTestCase(unittest.TestCase):
+    def test_matches(self):
+        cron = CronSpec('*/15 9-17 * * 1-5')
+        # A Monday
+        self.assertTrue(cron.matches(datetime(2018, 7, 2, 9, 45)))
+        self.assertFalse(cron.matches(datetime(2018, 7, 2, 9, 50)))
+        self.assertFalse(cron.matches(datetime(2018, 7, 2, 18, 0)))
+        # A Sunday
+        self.assertFalse(cron.matches(datetime(2018, 7, 1, 9, 45)))
+
+    def test_next_after(self):
+        self.assertEqual(
+            CronSpec('0 */6 * * *').next_after(datetime(2018, 7, 2, 6, 0)),
+            datetime(2018, 7, 2, 12, 0))
+        self.assertEqual(
+            CronSpec('30 8 1 * *').next_after(datetime(2018, 12, 15, 12, 0)),
+            datetime(2019, 1, 1, 8, 30))
+        # Sundays, written either way
+        for spec in ('0 0 * * 0', '0 0 * * 7'):
+            self.assertEqual(
+                CronSpec(spec).next_after(datetime(2018, 7, 2)),
+                datetime(2018, 7, 8))
+        self.assertEqual(
+            CronSpec('0 0 29 2 *').next_after(datetime(2018, 3, 1)),
+            datetime(2020, 2, 29))
+
+    def test_invalid(self):
+        for spec in ('* * * *', '60 * * * *', '*/0 * * * *', '5-1 * * * *'):
+            with self.assertRaises(ValueError):
+                CronSpec(spec)
@@ -0,0 +1,35 @@
+import unittest
+
+from app.search import TrigramIndex, similarity, trigrams
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex([
+            (1, 'Maria', 'Smith', 'maria.smith@example.com'),
+            (2, 'John', 'Smithers', 'jsmithers@example.com'),
+            (3, 'Osmin', 'Lopez', 'osmin@example.com'),
+            (4, 'Jennifer', 'Garcia', 'jgarcia@example.com'),
+        ])
+
+    def ids(self, query):
+        return [user_id for _, user_id in self.index.search(query)]
+
+    def test_trigrams_match_pg_trgm_padding(self):
+        self.assertEqual(trigrams('Cat'), set(['  c', ' ca', 'cat', 'at ']))
+        self.assertEqual(similarity(trigrams('smith'), trigrams('smith')), 1)
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(self.ids('smi')[:2], [1, 2])
+        self.assertNotIn(3, self.ids('smi')[:2])
+
+    def test_typos_still_match(self):
+        self.assertEqual(self.ids('garcai')[0], 4)
+
+    def test_add_and_remove(self):
+        self.index.add(5, 'Zora', 'Neale', 'zora@example.com')
+        self.assertEqual(self.ids('zora'), [5])
+        self.index.add(5, 'Zelda', 'Neale', 'zelda@example.com')
+        self.assertEqual(self.ids('zora'), [])
+        self.index.remove(5)
+        self.assertEqual(self.ids('zelda'), [])
@@ -0,0 +1,44 @@
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Role, SiteAttributes, User
+
+
+class SiteAttributesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(SiteAttributes(savings_goal=750, num_modules=3))
+        db.session.commit()
+        SiteAttributes.invalidate_cache()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.record)
+        SiteAttributes.invalidate_cache()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_creating_users_loads_settings_once(self):
+        role = Role.query.filter_by(default=True).first()
+        del self.statements[:]
+        users = [User(email='user{}@example.com'.format(i), role=role)
+                 for i in range(20)]
+        self.assertEqual(len(self.statements), 1)
+        self.assertTrue(all(u.goal_amount == 750 for u in users))
+        self.assertTrue(all(len(u.modules) == 3 for u in users))
+
+    def test_update_invalidates_cache(self):
+        self.assertEqual(SiteAttributes.get_savings_goal(), 750)
+        SiteAttributes.update(savings_goal=900)
+        self.assertEqual(SiteAttributes.get_savings_goal(), 900)
@@ -0,0 +1,50 @@
+import unittest
+
+from app import create_app, db
+from app.models import Role, User
+from app.sqlstats import NPlusOneError, statement_shape
+
+
+class SQLStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.add_url_rule('/_test/users', 'test_users', self.users_view)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add_all([User(email='user{}@example.com'.format(i))
+                            for i in range(12)])
+        db.session.commit()
+        self.ids = [user.id for user in User.query]
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def users_view(self):
+        from flask import request
+        if request.args.get('loop'):
+            # One query per user
+            emails = [User.query.filter_by(id=i).one().email for i in self.ids]
+        else:
+            users = User.query.filter(User.id.in_(self.ids))
+            emails = [u.email for u in users]
+        return ','.join(emails)
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            statement_shape('SELECT * FROM users\n  WHERE id IN (?, ?, ?) '
+                            "AND email = 'a@example.com' LIMIT 10"),
+            'SELECT * FROM users WHERE id IN (?) AND email = ? LIMIT ?')
+
+    def test_counts_in_headers(self):
+        response = self.app.test_client().get('/_test/users')
+        self.assertEqual(response.headers['X-SQL-Queries'], '1')
+        self.assertTrue(response.headers['X-SQL-Time'].endswith('ms'))
+
+    def test_n_plus_one_fails(self):
+        with self.assertRaises(NPlusOneError):
+            self.app.test_client().get('/_test/users?loop=1')
@@ -0,0 +1,69 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from webassets.bundle import Bundle
+from webassets.exceptions import BundleError
+
+from app import create_app
+from app.static_assets import build_assets, init_static_assets
+
+BUNDLE = 'scripts/app.0123456789ab.js'
+
+
+class StaticAssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.static, 'scripts'))
+        self.js = b'var scholars = [];\n' * 100
+        path = os.path.join(self.static, BUNDLE)
+        with open(path, 'wb') as f:
+            f.write(self.js)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(self.js))
+        manifest = os.path.join(self.static, 'manifest.json')
+        with open(manifest, 'w') as f:
+            json.dump({'bundles': {'app_js': BUNDLE}}, f)
+
+        self.app = create_app('testing')
+        self.app.static_folder = self.static
+        self.app.config['BUNDLE_MANIFEST'] = manifest
+        init_static_assets(self.app)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.static)
+
+    def test_urls_come_from_manifest(self):
+        with self.app.test_request_context():
+            self.assertEqual(
+                self.app.jinja_env.globals['asset_urls']('app_js'),
+                ['/static/' + BUNDLE])
+
+    def test_serves_precompressed(self):
+        response = self.client.get('/static/' + BUNDLE,
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.get_data()), self.js)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+
+    def test_serves_uncompressed(self):
+        response = self.client.get('/static/' + BUNDLE)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), self.js)
+
+    def test_unbuildable_bundle_without_earlier_build(self):
+        manifest = os.path.join(self.static, 'new-manifest.json')
+        self.app.config['BUNDLE_MANIFEST'] = manifest
+        missing = os.path.join(self.static, 'styles', 'app.css')
+        with mock.patch.object(Bundle, 'build',
+                               side_effect=BundleError('sass: not found')), \
+                mock.patch.object(Bundle, 'resolve_output',
+                                  return_value=missing):
+            self.assertRaises(BundleError, build_assets, self.app)
+        self.assertFalse(os.path.exists(manifest))
@@ -0,0 +1,82 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+from app import create_app, db
+from app.models import Role, Stage, User
+from app.uploads import get_s3_client, presign_upload
+
+# Presigning is done locally with these, so nothing talks to AWS
+FAKE_CREDENTIALS = {
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+}
+
+
+class UploadsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, FAKE_CREDENTIALS)
+        self.env.start()
+        self.app = create_app('testing')
+        self.app.config.update(S3_BUCKET='certificates', S3_REGION='us-east-2')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.env.stop()
+
+    def test_client_is_cached_with_configured_region(self):
+        client = get_s3_client()
+        self.assertIs(get_s3_client(), client)
+        self.assertEqual(client.meta.region_name, 'us-east-2')
+
+    def test_presign_upload(self):
+        upload = presign_upload('certificate.pdf', 'application/pdf')
+        key = upload['data']['fields']['key']
+        self.assertTrue(key.startswith('json/certificate'))
+        self.assertTrue(key.endswith('.pdf'))
+        self.assertEqual(upload['data']['fields']['Content-Type'],
+                         'application/pdf')
+        self.assertEqual(upload['url'],
+                         upload['url_upload'].rstrip('/') + '/' + key)
+
+    def sign_batch(self, client, files):
+        response = client.post('/account/sign-s3/batch',
+                               data=json.dumps({'files': files}),
+                               content_type='application/json')
+        return response.status_code, json.loads(
+            response.get_data(as_text=True))
+
+    def test_batch_endpoint(self):
+        user = User(email='scholar@example.com', password='password',
+                    stage=Stage.COMPLETED_EMAIL_CONF)
+        db.session.add(user)
+        db.session.commit()
+        with self.app.test_client() as client:
+            response = client.post('/account/login', data={
+                'email': 'scholar@example.com',
+                'password': 'password'
+            })
+            self.assertEqual(response.status_code, 302)
+            files = [{'name': 'module{}.pdf'.format(i),
+                      'type': 'application/pdf'} for i in range(3)]
+            status, body = self.sign_batch(client, files)
+            self.assertEqual(status, 200)
+            signed = body['files']
+            self.assertEqual(len(signed), 3)
+            self.assertEqual(len(set(s['url'] for s in signed)), 3)
+            self.assertEqual(signed[0]['data']['fields']['Content-Type'],
+                             'application/pdf')
+
+            self.assertEqual(self.sign_batch(client, files * 5)[0], 400)
+            for bad_type in (None, '', 42):
+                file = {'name': 'module.pdf', 'type': bad_type}
+                self.assertEqual(self.sign_batch(client, [file])[0], 400)
+            self.assertEqual(
+                self.sign_batch(client, [{'name': 'module.pdf'}])[0], 400)
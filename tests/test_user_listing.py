@@ -0,0 +1,66 @@
+import unittest
+
+from app import create_app, db
+from app.admin.user_listing import users_page
+from app.models import Role, Stage, User
+
+
+class UserListingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        for i, last_name in enumerate(['Cruz', 'Adams', 'Baker', 'Adams',
+                                       'Evans', 'Diaz', 'Baker']):
+            db.session.add(User(
+                first_name='Scholar',
+                last_name=last_name,
+                email='scholar{}@example.com'.format(i),
+                stage=Stage.COMPLETED_EMAIL_CONF if i % 2 else 0))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def all_pages(self, **kwargs):
+        users, after = users_page(limit=3, **kwargs)
+        while after is not None:
+            page, after = users_page(limit=3, after=after, **kwargs)
+            users.extend(page)
+        return users
+
+    def test_pages_cover_every_user_in_order(self):
+        users = self.all_pages()
+        self.assertEqual(len(users), 7)
+        self.assertEqual([(u.last_name, u.id) for u in users],
+                         sorted((u.last_name, u.id) for u in users))
+
+    def test_descending(self):
+        users = self.all_pages(sort='email', descending=True)
+        emails = [u.email for u in users]
+        self.assertEqual(emails, sorted(emails, reverse=True))
+
+    def test_filters(self):
+        role = Role.query.filter_by(default=True).first()
+        self.assertEqual(len(self.all_pages(role_id=role.id)), 7)
+        confirmed = self.all_pages(stage=Stage.COMPLETED_EMAIL_CONF)
+        self.assertEqual(len(confirmed), 3)
+
+    def test_users_without_a_name_are_not_skipped(self):
+        for i in range(4):
+            db.session.add(User(email='nameless{}@example.com'.format(i)))
+        db.session.commit()
+        for descending in (False, True):
+            users = self.all_pages(sort='first_name', descending=descending)
+            self.assertEqual(len(users), 11)
+            self.assertEqual(len(set(u.id for u in users)), 11)
+            nameless = [u for u in users if u.first_name is None]
+            self.assertEqual(len(nameless), 4)
+
+    def test_rejects_unknown_sort(self):
+        with self.assertRaises(ValueError):
+            users_page(sort='password_hash')
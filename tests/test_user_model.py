@@ -43,6 +43,17 @@ class UserModelTestCase(unittest.TestCase):
         token = u.generate_confirmation_token()
         self.assertTrue(u.confirm_account(token))
 
+    def test_batch_confirmation_tokens(self):
+        u1 = User(password='password')
+        u2 = User(password='notpassword')
+        db.session.add(u1)
+        db.session.add(u2)
+        db.session.commit()
+        t1, t2 = User.generate_confirmation_tokens([u1, u2])
+        self.assertTrue(u1.confirm_account(t1))
+        self.assertFalse(u1.confirm_account(t2))
+        self.assertTrue(u2.confirm_account(t2))
+
     def test_invalid_confirmation_token(self):
         u1 = User(password='password')
         u2 = User(password='notpassword')